@@ -0,0 +1 @@
+python scripts/hsl_batch_reviewer.py -checkpoint [HSL_MODEL_PATH] -device [cpu|cuda:0] -katago-path [KATAGO_EXECUTABLE_PATH] -katago-config [KATAGO_ANALYSIS_CFG_PATH] -katago-model [KATAGO_MODEL_PATH] -sgf-dir [SGF_DIR] -player [B|W]
\ No newline at end of file
@@ -0,0 +1,41 @@
+import os
+import time
+import argparse
+
+from load_model import load_model
+from compiled_model import compile_model, get_compiled_path
+from model_outputs import time_outputs, max_difference
+from sgfmetadata import SGFMetadata
+from review import load_sgf_game_state
+from humanslnet_server import REVIEW_OUTPUT_NAMES
+
+def main():
+    """Times the model and its compiled graph over every position of a game, and checks they give the same outputs."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='Game whose positions are evaluated', required=True)
+    parser.add_argument('-repeats', help='Times to evaluate every position', type=int, default=3, required=False)
+    args = parser.parse_args()
+
+    model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+    path = get_compiled_path(args.checkpoint, model.pos_len, args.device)
+    was_saved = os.path.exists(path)
+    start = time.perf_counter()
+    compiled_model = compile_model(model, args.checkpoint, args.device)
+    print(f"{'Loading' if was_saved else 'Tracing'} the compiled model took {time.perf_counter() - start:.2f}s ({path})")
+
+    game_state = load_sgf_game_state(args.sgf)
+    sgfmeta = SGFMetadata()
+    for max_batch_size in [1, 32]:
+        # Warm up, so neither timing includes one-time costs
+        time_outputs(game_state, model, sgfmeta, max_batch_size, REVIEW_OUTPUT_NAMES, 1)
+        time_outputs(game_state, compiled_model, sgfmeta, max_batch_size, REVIEW_OUTPUT_NAMES, 1)
+
+        outputs, seconds = time_outputs(game_state, model, sgfmeta, max_batch_size, REVIEW_OUTPUT_NAMES, args.repeats)
+        compiled_outputs, compiled_seconds = time_outputs(game_state, compiled_model, sgfmeta, max_batch_size, REVIEW_OUTPUT_NAMES, args.repeats)
+        print(f"batches of {max_batch_size}: model {seconds * 1000:.2f} ms, compiled {compiled_seconds * 1000:.2f} ms per position, "
+              f"max difference {max_difference(outputs, compiled_outputs):.2e}")
+
+if __name__ == "__main__":
+    main()
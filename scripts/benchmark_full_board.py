@@ -0,0 +1,85 @@
+import sys
+import time
+import argparse
+import torch
+
+from load_model import load_model
+from features import Features
+from fuse_model import fuse_for_inference
+from model_outputs import max_difference
+from gamestate import METADATA_CACHE
+from sgfmetadata import SGFMetadata
+from review import load_sgf_game_state
+
+def get_inputs(model, game_state, move_indices):
+    features = Features(model.config, model.pos_len)
+    bin_input_data, global_input_data = game_state.get_input_features(features, move_indices)
+    input_spatial = torch.tensor(bin_input_data, dtype=torch.float32, device=model.device)
+    input_global = torch.tensor(global_input_data, dtype=torch.float32, device=model.device)
+    input_meta_encoded = None
+    if model.metadata_encoder is not None:
+        settings = []
+        for move_idx in move_indices:
+            board = game_state.boards[move_idx]
+            settings.append((SGFMetadata(), board.pla, board.x_size*board.y_size))
+        input_meta_encoded = METADATA_CACHE.get_encoded(model, settings)
+    return input_spatial, input_global, input_meta_encoded
+
+def time_forward(model, inputs, full_board, repeats):
+    """Best time of repeats forward passes, in seconds, and the outputs of the last one."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        outputs = model(inputs[0], inputs[1], input_meta_encoded=inputs[2], full_board=full_board)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return outputs, best
+
+def main():
+    """Checks that the full-board forward path gives the same outputs as the masked one on the positions of a 19x19 game,
+    for the model as loaded and fused for inference, and times both paths."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='19x19 game whose positions are evaluated', required=True)
+    parser.add_argument('-max-batch-size', help='Max positions per forward pass', type=int, default=32, required=False)
+    parser.add_argument('-repeats', help='Times to run each forward pass, the best time counts', type=int, default=3, required=False)
+    parser.add_argument('-tolerance', help='Max difference allowed between the paths', type=float, default=1e-4, required=False)
+    args = parser.parse_args()
+
+    game_state = load_sgf_game_state(args.sgf)
+    board = game_state.board
+    if board.x_size != 19 or board.y_size != 19:
+        print(f"Error: The game is {board.x_size}x{board.y_size}, the full-board path needs 19x19")
+        sys.exit(1)
+
+    passed = True
+    for fused in [False, True]:
+        model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+        model.eval()
+        if fused:
+            fuse_for_inference(model)
+
+        difference = 0.0
+        masked_seconds = 0.0
+        full_board_seconds = 0.0
+        move_indices = list(range(len(game_state.moves) + 1))
+        with torch.no_grad():
+            for start in range(0, len(move_indices), args.max_batch_size):
+                inputs = get_inputs(model, game_state, move_indices[start:start+args.max_batch_size])
+                masked_outputs, seconds = time_forward(model, inputs, False, args.repeats)
+                masked_seconds += seconds
+                full_board_outputs, seconds = time_forward(model, inputs, True, args.repeats)
+                full_board_seconds += seconds
+                difference = max(difference, max_difference(masked_outputs, full_board_outputs))
+
+        print(f"{'fused' if fused else 'model'}: masked {masked_seconds / len(move_indices) * 1000:.2f} ms, "
+              f"full board {full_board_seconds / len(move_indices) * 1000:.2f} ms per position, max difference {difference:.2e}")
+        passed = passed and difference <= args.tolerance
+
+    if not passed:
+        print(f"Error: The full-board path differs from the masked path by more than {args.tolerance}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import numpy as np
+
+from load_model import load_model
+from model_outputs import time_outputs
+from sgfmetadata import SGFMetadata
+from review import load_sgf_game_state
+from humanslnet_server import REVIEW_OUTPUT_NAMES
+
+def main():
+    """Times get_model_outputs_batch over every position of a game, with all outputs and with only the ones the reviewers use."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='Game whose positions are evaluated', required=True)
+    parser.add_argument('-max-batch-size', help='Max positions per forward pass', type=int, default=32, required=False)
+    parser.add_argument('-repeats', help='Times to evaluate every position', type=int, default=3, required=False)
+    args = parser.parse_args()
+
+    model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+    game_state = load_sgf_game_state(args.sgf)
+    sgfmeta = SGFMetadata()
+
+    # Warm up, so neither timing includes one-time costs
+    time_outputs(game_state, model, sgfmeta, args.max_batch_size, None, 1)
+
+    all_outputs, all_seconds = time_outputs(game_state, model, sgfmeta, args.max_batch_size, None, args.repeats)
+    review_outputs, review_seconds = time_outputs(game_state, model, sgfmeta, args.max_batch_size, REVIEW_OUTPUT_NAMES, args.repeats)
+
+    print(f"all outputs: {all_seconds * 1000:.2f} ms per position")
+    print(f"{', '.join(REVIEW_OUTPUT_NAMES)}: {review_seconds * 1000:.2f} ms per position")
+
+    same = all(
+        all(np.array_equal(np.asarray(full[name], dtype=np.float64), np.asarray(selected[name], dtype=np.float64)) for name in REVIEW_OUTPUT_NAMES)
+        and set(selected.keys()) == set(REVIEW_OUTPUT_NAMES)
+        for full, selected in zip(all_outputs, review_outputs)
+    )
+    print(f"Same values as with all outputs: {same}")
+
+if __name__ == "__main__":
+    main()
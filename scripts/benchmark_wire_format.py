@@ -0,0 +1,72 @@
+import io
+import json
+import time
+import argparse
+import numpy as np
+
+from load_model import load_model
+from sgfmetadata import SGFMetadata
+from review import load_sgf_game_state
+from humanslnet_server import numpy_array_encoder, filter_outputs
+from wire_format import encode_binary, read_binary_frame
+
+def as_plain(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {key: as_plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [as_plain(value) for value in obj]
+    if isinstance(obj, np.floating):
+        return float(obj)
+    return obj
+
+def benchmark(name, responses, repeats):
+    """Prints the encode and decode time per position and the size of both wire formats, and checks they decode to the same values."""
+    results = {}
+    for wire_format in ["json", "binary"]:
+        encode_seconds = 0.0
+        decode_seconds = 0.0
+        total_bytes = 0
+        decoded = []
+        for _ in range(repeats):
+            decoded = []
+            for response in responses:
+                start = time.perf_counter()
+                if wire_format == "json":
+                    data = (json.dumps(response, default=numpy_array_encoder) + "\n").encode()
+                else:
+                    data = encode_binary(response)
+                encode_seconds += time.perf_counter() - start
+                total_bytes += len(data)
+
+                start = time.perf_counter()
+                if wire_format == "json":
+                    decoded.append(json.loads(data.decode()))
+                else:
+                    decoded.append(read_binary_frame(io.BytesIO(data[1:])))
+                decode_seconds += time.perf_counter() - start
+
+        count = len(responses) * repeats
+        results[wire_format] = [as_plain(response) for response in decoded]
+        print(f"{name} {wire_format}: encode {encode_seconds / count * 1000:.3f} ms, decode {decode_seconds / count * 1000:.3f} ms, {total_bytes / count / 1000:.1f} kB per position")
+
+    print(f"{name}: both formats decode to the same values: {results['json'] == results['binary']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='Game whose positions are sent', required=True)
+    parser.add_argument('-repeats', help='Times to encode and decode every position', type=int, default=5, required=False)
+    args = parser.parse_args()
+
+    model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+    game_state = load_sgf_game_state(args.sgf)
+    outputs = game_state.get_model_outputs_batch(model, sgfmeta=SGFMetadata())
+
+    benchmark("reviewer outputs", [dict(outputs=filter_outputs(output)) for output in outputs], args.repeats)
+    benchmark("all outputs", [dict(outputs=output) for output in outputs], args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -170,6 +170,25 @@ class Board:
             return False
         return True
 
+    #Same as would_be_legal for each of an array of on-board locs, as a boolean array
+    def legal_mask(self,pla,locs):
+        if pla != Board.BLACK and pla != Board.WHITE:
+            return np.zeros(len(locs), dtype=bool)
+        opp = Board.get_opp(pla)
+        liberties = self.group_liberty_count[self.group_head]
+
+        #Not single stone suicide if next to an empty point, an opponent group it captures, or an own stone
+        not_suicide = np.zeros(len(locs), dtype=bool)
+        for adj in self.adj:
+            adj_locs = locs + adj
+            adj_stones = self.board[adj_locs]
+            not_suicide |= (adj_stones == Board.EMPTY) | (adj_stones == pla) | ((adj_stones == opp) & (liberties[adj_locs] == 1))
+
+        legal = (self.board[locs] == Board.EMPTY) & not_suicide
+        if self.simple_ko_point is not None:
+            legal &= locs != self.simple_ko_point
+        return legal
+
     def would_be_suicide(self,pla,loc):
         adj0 = loc + self.adj[0]
         adj1 = loc + self.adj[1]
@@ -328,6 +347,15 @@ class Board:
     #Play a stone at the given location, with non-superko legality checking and updating the pla and simple ko point
     #Single stone suicide is disallowed but suicide is allowed, to support rule sets and sgfs that have suicide
     def play(self,pla,loc):
+        self.check_play(pla,loc)
+        self.playUnsafe(pla,loc)
+
+    #Same as play, but returns a record that can be passed to undo
+    def playRecorded(self,pla,loc):
+        self.check_play(pla,loc)
+        return self.playRecordedUnsafe(pla,loc)
+
+    def check_play(self,pla,loc):
         if pla != Board.BLACK and pla != Board.WHITE:
             raise IllegalMoveError("Invalid pla for board.play")
 
@@ -341,8 +369,6 @@ class Board:
             if loc == self.simple_ko_point:
                 raise IllegalMoveError("Move would be illegal simple ko recapture")
 
-        self.playUnsafe(pla,loc)
-
     def playUnsafe(self,pla,loc):
         if loc == Board.PASS_LOC:
             self.simple_ko_point = None
@@ -731,7 +757,7 @@ class Board:
 
             #Zero out all the stuff
             self.board[loc] = Board.EMPTY
-            self.zobrist ^= Board.ZOBRIST_STONE[opp][loc]
+            self.zobrist ^= Board.ZOBRIST_STONE[pla][loc]
             self.group_head[loc] = 0
             self.group_next[loc] = 0
             self.group_prev[loc] = 0
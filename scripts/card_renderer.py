@@ -0,0 +1,153 @@
+import io
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+from board import Board
+from review import GRID_RADIUS
+
+# Cards are drawn this many times larger and scaled down, since PIL doesn't antialias shapes
+SUPERSAMPLE = 2
+
+def font_of_points(points, scale=1):
+    # wx fonts are in points, PIL fonts in pixels (96 dpi)
+    return ImageFont.load_default(size=round(points * 96 / 72 * scale))
+
+class BoardDrawing:
+    """Maps board coordinates to pixels and draws the board, review grid and move markers with a painter, so
+    GoBoard on screen and CardRenderer in memory draw the same picture. Expects board_size, cell_size, margin
+    and scale attributes, scale being how many pixels a point of pen width is.
+
+    A painter has clear(color), line(x, y, x2, y2, color, width), circle(x, y, r, fill, outline, width),
+    rectangle(x, y, x2, y2, outline, width) and text(x, y, text, color, points, centered). Outlines are
+    centered on the shape, as wx draws them, and colors are RGB or RGBA tuples.
+    """
+
+    def get_desired_size(self):
+        board_width = self.board_size * self.cell_size + 2 * self.margin
+        board_height = self.board_size * self.cell_size + self.cell_size + 2 * self.margin
+        return board_width, board_height
+
+    def px_of_x(self, x):
+        return round(self.cell_size * x + self.margin + self.cell_size / 2)
+    def py_of_y(self, y):
+        return round(self.cell_size * y + self.margin + self.cell_size + self.cell_size / 2)
+
+    def x_of_px(self, px):
+        return round((px - self.margin - self.cell_size / 2) / self.cell_size)
+    def y_of_py(self, py):
+        return round((py - self.margin - self.cell_size - self.cell_size / 2) / self.cell_size)
+
+    def draw_board(self, painter, board, player):
+        s = self.scale
+        painter.clear((200, 150, 100))
+
+        for i in range(self.board_size):
+            painter.line(self.px_of_x(0), self.py_of_y(i), self.px_of_x(self.board_size - 1), self.py_of_y(i), (0, 0, 0), s)
+            painter.line(self.px_of_x(i), self.py_of_y(0), self.px_of_x(i), self.py_of_y(self.board_size - 1), (0, 0, 0), s)
+
+        r = self.cell_size // 2 - 2 * s
+        for x in range(self.board_size):
+            for y in range(self.board_size):
+                color = board.board[board.loc(x, y)]
+                if color == Board.BLACK:
+                    painter.circle(self.px_of_x(x), self.py_of_y(y), r, (0, 0, 0), (0, 0, 0), s)
+                elif color == Board.WHITE:
+                    painter.circle(self.px_of_x(x), self.py_of_y(y), r, (255, 255, 255), (0, 0, 0), s)
+
+        label = ("Black" if player == "B" else "White") + " to play"
+        painter.text(255 * s, 15 * s, label, (0, 150, 0), 16, False)
+
+        for x in range(self.board_size):
+            col_label = "ABCDEFGHJKLMNOPQRSTUVWXYZ"[x]
+            painter.text(self.px_of_x(x), self.py_of_y(-0.8), col_label, (0, 0, 0), 10, True)
+            painter.text(self.px_of_x(x), self.py_of_y(self.board_size - 0.2), col_label, (0, 0, 0), 10, True)
+
+        for y in range(self.board_size):
+            row_label = str(self.board_size - y)
+            painter.text(self.px_of_x(-0.8), self.py_of_y(y), row_label, (0, 0, 0), 10, True)
+            painter.text(self.px_of_x(self.board_size - 0.2), self.py_of_y(y), row_label, (0, 0, 0), 10, True)
+
+    def draw_review_grid(self, painter, actual_move):
+        half = self.cell_size / 2
+        x = self.px_of_x(max(actual_move.x - GRID_RADIUS, 0)) - half
+        y = self.py_of_y(max(actual_move.y - GRID_RADIUS, 0)) - half
+        x2 = self.px_of_x(min(actual_move.x + GRID_RADIUS, self.board_size - 1)) + half
+        y2 = self.py_of_y(min(actual_move.y + GRID_RADIUS, self.board_size - 1)) + half
+        painter.rectangle(x, y, x2, y2, (0, 0, 255), 4 * self.scale)
+
+    def draw_review_moves(self, painter, hsl_move, actual_move):
+        s = self.scale
+        painter.circle(self.px_of_x(hsl_move.x), self.py_of_y(hsl_move.y), self.cell_size // 2 - 6 * s, None, (0, 0, 0), 4 * s)
+        painter.text(self.px_of_x(actual_move.x), self.py_of_y(actual_move.y), "x", (0, 0, 0, 100), 26, True)
+
+class PilPainter:
+    """Paints BoardDrawing's shapes on a PIL image. PIL draws outlines inside the shape, so shapes grow by half the width."""
+
+    def __init__(self, image, scale):
+        self.draw = ImageDraw.Draw(image, "RGBA")
+        self.size = image.size
+        self.scale = scale
+        self.fonts = {}
+
+    def clear(self, color):
+        self.draw.rectangle((0, 0, self.size[0], self.size[1]), fill=color)
+
+    def line(self, x, y, x2, y2, color, width):
+        self.draw.line((x, y, x2, y2), fill=color, width=width)
+
+    def circle(self, x, y, r, fill, outline, width):
+        if outline is not None:
+            r += width / 2
+        self.draw.ellipse((x - r, y - r, x + r, y + r), fill=fill, outline=outline, width=width)
+
+    def rectangle(self, x, y, x2, y2, outline, width):
+        half = width / 2
+        self.draw.rectangle((x - half, y - half, x2 + half, y2 + half), outline=outline, width=width)
+
+    def text(self, x, y, text, color, points, centered):
+        if points not in self.fonts:
+            self.fonts[points] = font_of_points(points, self.scale)
+        self.draw.text((x, y), text, fill=color, font=self.fonts[points], anchor="mm" if centered else None)
+
+class CardRenderer(BoardDrawing):
+    """Draws question and answer cards into memory, the same way GoBoard draws the board on screen."""
+
+    def __init__(self, board_size=19, cell_size=30, margin=30):
+        self.board_size = board_size
+        self.scale = SUPERSAMPLE
+        self.cell_size = cell_size * SUPERSAMPLE
+        self.margin = margin * SUPERSAMPLE
+        self.output_size = (board_size * cell_size + 2 * margin, board_size * cell_size + cell_size + 2 * margin)
+
+    def render(self, board, player, actual_move, hsl_move=None, difficulty=None):
+        image = Image.new("RGB", self.get_desired_size())
+        painter = PilPainter(image, self.scale)
+
+        self.draw_board(painter, board, player)
+        self.draw_review_grid(painter, actual_move)
+        if hsl_move is not None:
+            self.draw_review_moves(painter, hsl_move, actual_move)
+        if difficulty is not None:
+            painter.text(15 * self.scale, 15 * self.scale, f"HSL from {difficulty}", (0, 0, 0), 16, False)
+
+        return image.resize(self.output_size, Image.LANCZOS)
+
+    def render_card(self, board, player, card):
+        """Returns the question and answer of a card as png bytes."""
+        pngs = []
+        for hsl_move, difficulty in [(None, None), (card.hsl_move, card.difficulty)]:
+            buffer = io.BytesIO()
+            self.render(board, player, card.actual_move, hsl_move, difficulty).save(buffer, format="PNG")
+            pngs.append(buffer.getvalue())
+        return pngs[0], pngs[1]
+
+    def write_card(self, output_path, filename, board, player, card):
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+
+        question, answer = self.render_card(board, player, card)
+        with open(os.path.join(output_path, filename + "_1.png"), "wb") as f:
+            f.write(question)
+        with open(os.path.join(output_path, filename + "_2.png"), "wb") as f:
+            f.write(answer)
@@ -0,0 +1,75 @@
+import sys
+import random
+import argparse
+
+from board import Board
+from review import load_sgf_game_state
+from check_features import BOARD_SIZES, get_random_game
+
+def board_state(board):
+    """Everything a position's features can depend on."""
+    return (
+        board.pla,
+        board.board.tobytes(),
+        board.zobrist,
+        board.simple_ko_point,
+        (board.num_captures_made[Board.BLACK], board.num_captures_made[Board.WHITE]),
+        (board.num_non_pass_moves_made[Board.BLACK], board.num_non_pass_moves_made[Board.WHITE]),
+    )
+
+def check_game(game_state):
+    """Mismatches between undoing back to each position, the board history and replaying the moves on a new board."""
+    errors = []
+    moves = list(game_state.moves)
+    expected = []
+    board = Board(size=game_state.board_size)
+    expected.append(board_state(board))
+    for pla, loc in moves:
+        board.play(pla, loc)
+        expected.append(board_state(board))
+
+    for idx in range(len(moves), -1, -1):
+        if board_state(game_state.boards[idx]) != expected[idx]:
+            errors.append(f"boards[{idx}] differs from replaying the moves")
+        if board_state(game_state.board) != expected[idx]:
+            errors.append(f"undo back to {idx} moves differs from replaying the moves")
+        if idx > 0:
+            game_state.undo()
+
+    for idx in range(1, len(moves) + 1):
+        game_state.redo()
+        if board_state(game_state.board) != expected[idx]:
+            errors.append(f"redo to {idx} moves differs from replaying the moves")
+    return errors
+
+def main():
+    """Checks that GameState.undo and redo and the board history give the same boards as replaying the moves,
+    on random games of several board sizes with consecutive moves of the same color, and on SGF files."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-sgf', help='Games to check as well, setup and handicap stones become moves', nargs='*', default=[], required=False)
+    parser.add_argument('-games', help='Random games per board size', type=int, default=5, required=False)
+    parser.add_argument('-moves', help='Moves per random game', type=int, default=120, required=False)
+    parser.add_argument('-seed', help='Random seed', type=int, default=0, required=False)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    games = []
+    for board_size in BOARD_SIZES:
+        for i in range(args.games):
+            games.append((f"random {board_size} #{i}", get_random_game(board_size, args.moves, rand)))
+    for sgf_file in args.sgf:
+        games.append((sgf_file, load_sgf_game_state(sgf_file)))
+
+    num_errors = 0
+    for name, game_state in games:
+        errors = check_game(game_state)
+        num_errors += len(errors)
+        for error in errors[:5]:
+            print(f"{name}: {error}")
+    print(f"{len(games)} games, {num_errors} mismatches")
+    if num_errors > 0:
+        print("Error: The board history doesn't match replaying the moves")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
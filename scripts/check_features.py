@@ -0,0 +1,131 @@
+import sys
+import random
+import argparse
+import numpy as np
+
+import modelconfigs
+from board import Board, IllegalMoveError
+from features import Features
+from gamestate import GameState
+
+BOARD_SIZES = [9, 13, 19, (19, 13)]
+
+def get_random_game(board_size, num_moves, rand):
+    """Legal random moves, with runs of moves of the same color like setup and handicap stones, and passes."""
+    game_state = GameState(board_size, GameState.RULES_JAPANESE)
+    board = game_state.board
+    locs = [board.loc(x, y) for y in range(board.y_size) for x in range(board.x_size)]
+    pla = Board.BLACK
+    while len(game_state.moves) < num_moves:
+        if rand.random() < 0.2:
+            pla = Board.get_opp(pla)
+        loc = Board.PASS_LOC if rand.random() < 0.03 else rand.choice(locs)
+        try:
+            game_state.play(pla, loc)
+        except IllegalMoveError:
+            continue
+        if rand.random() < 0.7:
+            pla = Board.get_opp(pla)
+    return game_state
+
+RULES = {
+    "japanese": GameState.RULES_JAPANESE,
+    "chinese": GameState.RULES_CHINESE,
+    "tromp-taylor": GameState.RULES_TT,
+    "japanese encore 2": dict(GameState.RULES_JAPANESE, encorePhase=2),
+    "territory encore 2": dict(GameState.RULES_JAPANESE, taxRule="TAX_NONE", encorePhase=2),
+    "chinese seki tax": dict(GameState.RULES_CHINESE, taxRule="TAX_SEKI"),
+}
+
+# The planes fill_row_features writes with fancy indexing over loc_pos_map
+POINT_PLANES = [0, 1, 2, 3, 4, 5, 18, 19, 20, 21]
+
+def fill_point_planes_by_loop(features, board, pla, opp, rules, row):
+    """The point planes as fill_row_features used to write them, one intersection at a time. row is (HW)C."""
+    for y in range(board.y_size):
+        for x in range(board.x_size):
+            pos = features.xy_to_tensor_pos(x,y)
+            row[pos,0] = 1.0
+            loc = board.loc(x,y)
+            stone = board.board[loc]
+            if stone == pla:
+                row[pos,1] = 1.0
+            elif stone == opp:
+                row[pos,2] = 1.0
+
+            if stone == pla or stone == opp:
+                libs = board.num_liberties(loc)
+                if libs == 1:
+                    row[pos,3] = 1.0
+                elif libs == 2:
+                    row[pos,4] = 1.0
+                elif libs == 3:
+                    row[pos,5] = 1.0
+
+    area = features.calculate_area(board,rules)
+    for y in range(board.y_size):
+        for x in range(board.x_size):
+            loc = board.loc(x,y)
+            pos = features.xy_to_tensor_pos(x,y)
+            if area[loc] == pla:
+                row[pos,18] = 1.0
+            elif area[loc] == opp:
+                row[pos,19] = 1.0
+
+    if rules["encorePhase"] >= 2:
+        for y in range(board.y_size):
+            for x in range(board.x_size):
+                pos = features.xy_to_tensor_pos(x,y)
+                loc = board.loc(x,y)
+                stone = board.board[loc]
+                if stone == pla:
+                    row[pos,20] = 1.0
+                elif stone == opp:
+                    row[pos,21] = 1.0
+
+def check_game(features, game_state, rules):
+    """Number of positions of game_state whose features under rules differ from writing the point planes by loop."""
+    pos_len = features.pos_len
+    mismatches = 0
+    for move_idx in range(len(game_state.moves) + 1):
+        board = game_state.boards[move_idx]
+        pla = board.pla
+        opp = Board.get_opp(pla)
+        bin_input_data = np.zeros([1, pos_len*pos_len, features.bin_input_shape[0]], dtype=np.float32)
+        global_input_data = np.zeros([1] + features.global_input_shape, dtype=np.float32)
+        features.fill_row_features(board,pla,opp,game_state.boards,game_state.moves,move_idx,rules,bin_input_data,global_input_data,idx=0)
+
+        expected = bin_input_data[0].copy()
+        expected[:, POINT_PLANES] = 0.0
+        fill_point_planes_by_loop(features, board, pla, opp, rules, expected)
+        if not np.array_equal(bin_input_data[0], expected):
+            mismatches += 1
+    return mismatches
+
+def main():
+    """Checks that the point planes fill_row_features writes with fancy indexing over loc_pos_map are bit-identical
+    to writing them one intersection at a time, on random games of several board sizes under each rules set."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-config', help='Model config whose features are checked', default="b18c384nbt", required=False)
+    parser.add_argument('-games', help='Random games per board size', type=int, default=1, required=False)
+    parser.add_argument('-moves', help='Moves per random game', type=int, default=80, required=False)
+    parser.add_argument('-seed', help='Random seed', type=int, default=0, required=False)
+    args = parser.parse_args()
+
+    features = Features(modelconfigs.config_of_name[args.config], 19)
+    rand = random.Random(args.seed)
+    total_mismatches = 0
+    for board_size in BOARD_SIZES:
+        game_states = [get_random_game(board_size, args.moves, rand) for _ in range(args.games)]
+        for rules_name, rules in RULES.items():
+            positions = sum(len(game_state.moves) + 1 for game_state in game_states)
+            mismatches = sum(check_game(features, game_state, rules) for game_state in game_states)
+            total_mismatches += mismatches
+            print(f"{str(board_size):>8} {rules_name:>18}: {positions} positions, {mismatches} mismatches")
+
+    if total_mismatches > 0:
+        print("Error: The vectorized point planes differ from the loop")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import glob
+import time
+import argparse
+
+from review import (
+    HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL,
+    CardFinder, is_card, get_sgfmeta, load_sgf_game_state,
+    start_hsl_server, start_kata_server,
+)
+from hsl_batch_reviewer import BatchReviewer
+
+def describe_diffs(name, diffs):
+    if not diffs:
+        return f"{name}: no positions"
+    diffs = sorted(diffs)
+    mean = sum(diffs) / len(diffs)
+    p90 = diffs[min(len(diffs) - 1, int(len(diffs) * 0.9))]
+    return f"{name}: mean {mean:.2f}, 90% {p90:.2f}, max {diffs[-1]:.2f} points over {len(diffs)} positions"
+
+def main():
+    """Scores the same candidates with three KataGo queries each and with one merged grid query,
+    and reports how far the scores and the found cards differ, and what each costs."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', required=True)
+    parser.add_argument('-max-batch-size', help='Max positions the HSL model evaluates at once', type=int, default=32, required=False)
+    parser.add_argument('-katago-path', help='KataGo executable', required=True)
+    parser.add_argument('-katago-config', help='KataGo analysis config', required=True)
+    parser.add_argument('-katago-model', help='KataGo model', required=True)
+    parser.add_argument('-sgf-dir', help='Directory with the SGF files to compare on', required=True)
+    parser.add_argument('-player', help='Color you played in the games', choices=["B", "W"], required=True)
+    args = parser.parse_args()
+
+    sgf_files = sorted(glob.glob(os.path.join(args.sgf_dir, "*.sgf")))
+    if not sgf_files:
+        print(f"Error: No sgf files found in {args.sgf_dir}")
+        sys.exit(1)
+
+    hsl_server_process = start_hsl_server(args.checkpoint, args.device, ["-max-batch-size", str(args.max_batch_size)])
+    kata_server = start_kata_server(args.katago_path, args.katago_config, args.katago_model)
+    sgfmeta = get_sgfmeta(HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL)
+
+    # Neither uses the KataGo cache, so both pay for every query
+    reviewer = BatchReviewer(hsl_server_process, kata_server, args.player, None, sgfmeta)
+    separate = CardFinder(kata_server, merged_query=False)
+    merged = CardFinder(kata_server, merged_query=True)
+
+    hsl_diffs = []
+    actual_diffs = []
+    kata_diffs = []
+    card_counts = {"both": 0, "separate only": 0, "merged only": 0}
+    separate_seconds = 0.0
+    merged_seconds = 0.0
+    candidate_count = 0
+    try:
+        for sgf_file in sgf_files:
+            _, candidates = reviewer.get_candidates(load_sgf_game_state(sgf_file))
+            candidate_count += len(candidates)
+
+            start = time.perf_counter()
+            separate_scores = separate.get_kata_scores(candidates, args.player)
+            separate_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            merged_scores = merged.get_kata_scores(candidates, args.player)
+            merged_seconds += time.perf_counter() - start
+
+            for separate_score, merged_score in zip(separate_scores, merged_scores):
+                hsl_diffs.append(abs(separate_score[0] - merged_score[0]))
+                actual_diffs.append(abs(separate_score[1] - merged_score[1]))
+                if separate_score[2] is not None:
+                    kata_diffs.append(abs(separate_score[2] - merged_score[2]))
+
+                separate_card = is_card(args.player, *separate_score)
+                merged_card = is_card(args.player, *merged_score)
+                if separate_card and merged_card:
+                    card_counts["both"] += 1
+                elif separate_card:
+                    card_counts["separate only"] += 1
+                elif merged_card:
+                    card_counts["merged only"] += 1
+
+            print(f"{os.path.basename(sgf_file)}: {len(candidates)} candidates")
+    finally:
+        hsl_server_process.terminate()
+        kata_server.close()
+
+    print(f"Candidates: {candidate_count}")
+    print(f"Separate queries: {separate.kata_queries} queries, {separate.kata_visits} visits, {separate_seconds:.2f}s")
+    print(f"Merged query: {merged.kata_queries} queries ({merged.kata_queries - candidate_count} for moves with too few visits), {merged.kata_visits} visits, {merged_seconds:.2f}s")
+    print(describe_diffs("HSL move score difference", hsl_diffs))
+    print(describe_diffs("Actual move score difference", actual_diffs))
+    print(describe_diffs("KataGo best score difference", kata_diffs))
+    print(f"Cards: {card_counts['both']} in both, {card_counts['separate only']} only with separate queries, {card_counts['merged only']} only with the merged query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import hashlib
+import logging
+import warnings
+
+import torch
+
+from features import Features
+
+class TracedForward(torch.nn.Module):
+    """Model.forward without extra outputs and with the metadata already encoded, in a form torch.jit.trace accepts.
+    forward_full_board is the same on the full-board path, which torch.jit.trace_module traces separately."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_spatial, input_global, input_meta_encoded=None):
+        return self.model(input_spatial, input_global, input_meta_encoded=input_meta_encoded)
+
+    def forward_full_board(self, input_spatial, input_global, input_meta_encoded=None):
+        return self.model(input_spatial, input_global, input_meta_encoded=input_meta_encoded, full_board=True)
+
+class CompiledModel:
+    """A Model whose forward passes run a TorchScript graph traced from it, which saves the Python overhead of
+    calling every block and layer. Everything else goes to the Model, so this can be used wherever a Model is.
+
+    Forward passes the graph can't do, with extra outputs or with metadata that isn't encoded yet, run the Model.
+    Graph forward passes report no available extra outputs.
+    """
+
+    def __init__(self, model, graph):
+        self.model = model
+        self.graph = graph
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, input_spatial, input_global, input_meta=None, extra_outputs=None, input_meta_encoded=None, full_board=False):
+        needs_model = (
+            (extra_outputs is not None and len(extra_outputs.requested) > 0)
+            or (self.model.metadata_encoder is not None and input_meta_encoded is None)
+        )
+        if needs_model:
+            return self.model(
+                input_spatial, input_global, input_meta=input_meta, extra_outputs=extra_outputs,
+                input_meta_encoded=input_meta_encoded, full_board=full_board,
+            )
+        graph_forward = self.graph.forward_full_board if full_board else self.graph.forward
+        if self.model.metadata_encoder is None:
+            return graph_forward(input_spatial, input_global)
+        return graph_forward(input_spatial, input_global, input_meta_encoded)
+
+def get_compiled_path(checkpoint_file, pos_len, device, variant=""):
+    """Where the graph of a checkpoint is kept. Changing the checkpoint, pos_len, device, torch version or variant
+    (which weights were loaded and how the model was transformed after loading, such as "swa,fused") gives a new path."""
+    stat = os.stat(checkpoint_file)
+    # The last field changes whenever the traced methods do, so graphs from older versions of this file aren't loaded
+    key = f"{os.path.abspath(checkpoint_file)}|{stat.st_size}|{stat.st_mtime_ns}|{pos_len}|{device}|{torch.__version__}|{variant}|full_board"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:12]
+    return f"{os.path.splitext(checkpoint_file)[0]}.traced-{digest}.pt"
+
+def get_example_inputs(model, batch_size=2):
+    features = Features(model.config, model.pos_len)
+    input_spatial = torch.rand([batch_size] + features.bin_input_shape, device=model.device)
+    # Channel 0 is the on-board mask
+    input_spatial[:, 0] = 1.0
+    input_global = torch.rand([batch_size] + features.global_input_shape, device=model.device)
+    if model.metadata_encoder is None:
+        return (input_spatial, input_global)
+    input_meta_encoded = torch.rand([batch_size, model.metadata_encoder.c_trunk], device=model.device)
+    return (input_spatial, input_global, input_meta_encoded)
+
+def is_same_as_model(graph, model, example_inputs, tolerance, methods=("forward", "forward_full_board")):
+    """Whether methods of graph give the outputs of model on example_inputs."""
+    traced_forward = TracedForward(model)
+    for method in methods:
+        model_outputs = getattr(traced_forward, method)(*example_inputs)
+        graph_outputs = getattr(graph, method)(*example_inputs)
+        for model_head, graph_head in zip(model_outputs, graph_outputs):
+            for model_output, graph_output in zip(model_head, graph_head):
+                if not torch.allclose(model_output, graph_output, atol=tolerance, rtol=tolerance):
+                    return False
+    return True
+
+def compile_model(model, checkpoint_file, device, variant="", tolerance=1e-4):
+    """Returns model as a CompiledModel. The graph is loaded from next to the checkpoint if an earlier run
+    traced it already and it still gives the model's outputs, otherwise traced, checked against the model and saved there."""
+    model.eval()
+    path = get_compiled_path(checkpoint_file, model.pos_len, device, variant)
+
+    # TorchScript warns that it's deprecated and that the asserts on shapes become constants
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore")
+        if os.path.exists(path):
+            logging.info(f"Loading compiled model from: {path}")
+            graph = torch.jit.load(path, map_location=device)
+            # Both methods share the weights, so one method on one position is enough to catch a graph of
+            # other weights, and keeps the startup cost low
+            if is_same_as_model(graph, model, get_example_inputs(model, batch_size=1), tolerance, methods=["forward_full_board"]):
+                return CompiledModel(model, graph)
+            logging.warning(f"Compiled model at {path} doesn't give the same outputs as the model, tracing it again")
+
+        example_inputs = get_example_inputs(model)
+        graph = torch.jit.trace_module(TracedForward(model), {"forward": example_inputs, "forward_full_board": example_inputs})
+        if not is_same_as_model(graph, model, example_inputs, tolerance):
+            raise ValueError("Compiled model doesn't give the same outputs as the model")
+
+        try:
+            torch.jit.save(graph, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            logging.info(f"Saved compiled model to: {path}")
+        except OSError as e:
+            logging.warning(f"Could not save compiled model to {path}: {e}")
+    return CompiledModel(model, graph)
@@ -0,0 +1,94 @@
+import sys
+import math
+import time
+import argparse
+import numpy as np
+
+from load_model import load_model
+from features import Features
+from review import (
+    HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL,
+    HSL_SOURCE_OPTIONS, HSL_DATE_OPTIONS, HSL_TIME_CONTROL_OPTIONS, HSL_RANK_OPTIONS,
+    get_sgfmeta, get_rank_sweep_sgfmetas, load_sgf_game_state_with_setup, is_player_move,
+)
+
+# Keeps a move HSL gives no chance at all from dominating the likelihood
+MIN_MOVE_PROB = 1e-6
+
+def get_move_log_likelihoods(model, game_state, player, sgfmetas, max_batch_size, num_setup_moves=0):
+    """Log probability of each of the player's moves in the game under each of sgfmetas, as an array of moves x sgfmetas.
+    The first num_setup_moves moves are setup stones, such as handicap stones, which the player didn't choose.
+    Every position is evaluated under all sgfmetas in the same batches, so its features are computed once."""
+    move_indices = [i for i, (pla, loc) in enumerate(game_state.moves) if i >= num_setup_moves and is_player_move(player, pla)]
+    if not move_indices:
+        return np.zeros((0, len(sgfmetas)))
+
+    outputs = game_state.get_model_outputs_batch(
+        model,
+        [move_idx for move_idx in move_indices for _ in sgfmetas],
+        sgfmeta=[sgfmeta for _ in move_indices for sgfmeta in sgfmetas],
+        max_batch_size=max_batch_size,
+        output_names=["policy0"],
+    )
+
+    features = Features(model.config, model.pos_len)
+    log_likelihoods = np.zeros((len(move_indices), len(sgfmetas)))
+    for i, move_idx in enumerate(move_indices):
+        board = game_state.boards[move_idx]
+        pos = features.loc_to_tensor_pos(game_state.moves[move_idx][1], board)
+        for j in range(len(sgfmetas)):
+            log_likelihoods[i, j] = math.log(max(outputs[i * len(sgfmetas) + j]["policy0"][pos], MIN_MOVE_PROB))
+    return log_likelihoods
+
+def main():
+    """Estimates the HSL rank of a player from their moves in one or more games: the rank under which HSL finds
+    the moves most likely, and how likely each rank is relative to the others."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='Games of the player', nargs='+', required=True)
+    parser.add_argument('-player', help='Color the player had in the games', choices=["B", "W"], required=True)
+    parser.add_argument('-source', help='HSL source to estimate the rank on', choices=HSL_SOURCE_OPTIONS, default=HSL_SOURCE, required=False)
+    parser.add_argument('-date', help='HSL date', type=int, choices=HSL_DATE_OPTIONS, default=HSL_DATE, required=False)
+    parser.add_argument('-time-control', help='HSL time control', choices=HSL_TIME_CONTROL_OPTIONS, default=HSL_TIME_CONTROL, required=False)
+    parser.add_argument('-max-batch-size', help='Max positions per forward pass', type=int, default=64, required=False)
+    args = parser.parse_args()
+
+    model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+    if model.metadata_encoder is None:
+        print("Error: The checkpoint has no metadata encoder, so its predictions don't depend on rank")
+        sys.exit(1)
+
+    # Human ranks only, "KG" is KataGo's own play
+    ranks = HSL_RANK_OPTIONS[1:]
+    sgfmetas = get_rank_sweep_sgfmetas(get_sgfmeta(args.source, HSL_RANK, args.date, args.time_control))[1:]
+
+    start = time.perf_counter()
+    total = np.zeros(len(ranks))
+    num_moves = 0
+    for sgf_file in args.sgf:
+        game_state, num_setup_moves = load_sgf_game_state_with_setup(sgf_file)
+        log_likelihoods = get_move_log_likelihoods(model, game_state, args.player, sgfmetas, args.max_batch_size, num_setup_moves)
+        num_moves += len(log_likelihoods)
+        total += log_likelihoods.sum(axis=0)
+    seconds = time.perf_counter() - start
+
+    if num_moves == 0:
+        print(f"Error: The player has no moves as {args.player} in the games")
+        sys.exit(1)
+
+    # Relative likelihood of each rank, as if all ranks were equally likely beforehand
+    confidence = np.exp(total - total.max())
+    confidence /= confidence.sum()
+
+    print(f"{num_moves} moves in {len(args.sgf)} games, {len(ranks)} ranks ({seconds:.1f}s)")
+    print(f"{'Rank':>5} {'Log-likelihood':>15} {'Per move':>9} {'Confidence':>11}")
+    for rank, log_likelihood, rank_confidence in zip(ranks, total, confidence):
+        bar = "#" * round(rank_confidence * 40)
+        print(f"{rank:>5} {log_likelihood:>15.1f} {log_likelihood / num_moves:>9.3f} {rank_confidence:>11.3f} {bar}")
+
+    best = int(np.argmax(total))
+    print(f"Most likely rank: {ranks[best]} ({confidence[best]:.0%} confidence)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+from load_model import load_model
+from features import Features
+from fuse_model import fuse_for_inference
+from reduced_precision import PRECISION_OPTIONS, get_precision_error, apply_precision
+from review import HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL, get_sgfmeta, load_sgf_game_state
+
+EVALUATED_OUTPUT_NAMES = ["top_move0", "value", "lead"]
+
+def get_corpus_outputs(model, game_states, sgfmeta, max_batch_size):
+    """Outputs at every position of every game, and the seconds per position they took."""
+    # Warm up, so the timing doesn't include one-time costs of the model
+    game_states[0].get_model_outputs_batch(model, [0], sgfmeta=sgfmeta, max_batch_size=max_batch_size, output_names=EVALUATED_OUTPUT_NAMES)
+
+    outputs = []
+    start = time.perf_counter()
+    for game_state in game_states:
+        outputs.extend(game_state.get_model_outputs_batch(model, sgfmeta=sgfmeta, max_batch_size=max_batch_size, output_names=EVALUATED_OUTPUT_NAMES))
+    return outputs, (time.perf_counter() - start) / len(outputs)
+
+def main():
+    """Compares reduced-precision modes of the model with float32 over every position of a corpus of games:
+    how often HSL still plays the same move, which is what picks the cards, and how much its win probability
+    and lead change. Also times every mode, to pick the fastest one that keeps the cards the same."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', default="cpu", required=False)
+    parser.add_argument('-sgf', help='Games whose positions are evaluated', nargs='+', required=True)
+    parser.add_argument('-precisions', help='Modes to compare with fp32', nargs='+', choices=PRECISION_OPTIONS[1:], default=PRECISION_OPTIONS[1:], required=False)
+    parser.add_argument('-fuse', help='Fuse the model first, as the server does with -fuse', action='store_true', required=False)
+    parser.add_argument('-max-batch-size', help='Max positions per forward pass', type=int, default=32, required=False)
+    args = parser.parse_args()
+
+    for precision in args.precisions:
+        precision_error = get_precision_error(precision, args.device, False)
+        if precision_error is not None:
+            print(f"Error: {precision_error}", file=sys.stderr)
+            sys.exit(1)
+
+    game_states = [load_sgf_game_state(sgf_file) for sgf_file in args.sgf]
+    sgfmeta = get_sgfmeta(HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL)
+
+    results = {}
+    for precision in ["fp32"] + args.precisions:
+        model, swa_model, _ = load_model(args.checkpoint, use_swa=False, device=args.device, pos_len=19, verbose=False)
+        if not results:
+            # The game states cache their ladder searches, which the first mode timed would pay for
+            for game_state in game_states:
+                features = Features(model.config, model.pos_len, ladder_cache=game_state.ladder_cache)
+                game_state.get_input_features(features, list(range(len(game_state.moves) + 1)))
+        model.eval()
+        if args.fuse:
+            model = fuse_for_inference(model)
+        results[precision] = get_corpus_outputs(apply_precision(model, precision), game_states, sgfmeta, args.max_batch_size)
+
+    fp32_outputs, fp32_seconds = results["fp32"]
+    print(f"{len(fp32_outputs)} positions in {len(game_states)} games")
+    print(f"{'Mode':>5} {'ms/pos':>7} {'Top-1 agree':>12} {'Moves changed':>14} {'|dValue| mean':>14} {'max':>7} {'|dLead| mean':>13} {'max':>7}")
+    for precision, (outputs, seconds) in results.items():
+        same_move = np.array([output["top_move0"][0] == fp32["top_move0"][0] for output, fp32 in zip(outputs, fp32_outputs)])
+        # Win probability of the player to move
+        value_deltas = np.array([abs(float(output["value"][0]) - float(fp32["value"][0])) for output, fp32 in zip(outputs, fp32_outputs)])
+        lead_deltas = np.array([abs(output["lead"] - fp32["lead"]) for output, fp32 in zip(outputs, fp32_outputs)])
+        print(f"{precision:>5} {seconds * 1000:>7.2f} {same_move.mean():>12.2%} {int((~same_move).sum()):>14} "
+              f"{value_deltas.mean():>14.4f} {value_deltas.max():>7.4f} {lead_deltas.mean():>13.3f} {lead_deltas.max():>7.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,54 @@
 import math
 import numpy as np
-from typing import Callable, List
+from collections import OrderedDict
+from typing import Callable, List, Optional
 
 from board import Board, Loc, Pos, Player
 import modelconfigs
 
+class LadderCache:
+    """Remembers the laddered chains of recently seen boards.
+
+    Ladder features use the current board and the two boards before it, so when stepping through a game
+    two of the three boards were already searched for the previous position. Whether a chain is laddered
+    depends on stones anywhere on the board (ladder breakers), so results are keyed by the whole board
+    (stone zobrist plus simple ko point, which 2-liberty searches depend on) rather than by chain.
+    """
+
+    def __init__(self, max_boards: int = 256):
+        self.max_boards = max_boards
+        self.laddered_of_board = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, board):
+        return (board.x_size, board.y_size, board.zobrist, board.simple_ko_point)
+
+    def get(self, board):
+        key = self.key(board)
+        laddered = self.laddered_of_board.get(key)
+        if laddered is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.laddered_of_board.move_to_end(key)
+        return laddered
+
+    def put(self, board, laddered):
+        self.laddered_of_board[self.key(board)] = laddered
+        while len(self.laddered_of_board) > self.max_boards:
+            self.laddered_of_board.popitem(last=False)
+
 class Features:
-    def __init__(self, config: modelconfigs.ModelConfig, pos_len: int):
+    def __init__(self, config: modelconfigs.ModelConfig, pos_len: int, ladder_cache: Optional[LadderCache] = None):
         self.config = config
+        self.ladder_cache = ladder_cache
         self.pos_len = pos_len
         self.version = modelconfigs.get_version(config)
         self.pass_pos = self.pos_len * self.pos_len
         self.bin_input_shape = [modelconfigs.get_num_bin_input_features(config), pos_len, pos_len]
         self.global_input_shape = [modelconfigs.get_num_global_input_features(config)]
+        self.loc_pos_maps = {}
 
     def xy_to_tensor_pos(self,x,y):
         return y * self.pos_len + x
@@ -21,6 +57,20 @@ class Features:
             return self.pass_pos
         return board.loc_y(loc) * self.pos_len + board.loc_x(loc)
 
+    #Returns the locs of all points on the board and their tensor positions, as two aligned arrays in row major order
+    def loc_pos_map(self,board):
+        key = (board.x_size,board.y_size)
+        if key not in self.loc_pos_maps:
+            assert(self.pos_len >= board.x_size)
+            assert(self.pos_len >= board.y_size)
+            xs, ys = np.meshgrid(np.arange(board.x_size), np.arange(board.y_size))
+            xs = xs.reshape(-1)
+            ys = ys.reshape(-1)
+            locs = (xs+1) + board.dy*(ys+1)
+            poss = ys * self.pos_len + xs
+            self.loc_pos_maps[key] = (locs, poss)
+        return self.loc_pos_maps[key]
+
     def tensor_pos_to_loc(self,pos,board):
         if pos == self.pass_pos:
             return None
@@ -56,6 +106,20 @@ class Features:
 
     #Calls f on each location that is part of an inescapable atari, or a group that can be put into inescapable atari
     def iterLadders(self, board, f):
+        if self.ladder_cache is not None:
+            laddered = self.ladder_cache.get(board)
+            if laddered is None:
+                laddered = self.findLadders(board)
+                self.ladder_cache.put(board, laddered)
+        else:
+            laddered = self.findLadders(board)
+
+        for loc, workingMoves in laddered:
+            f(loc,self.loc_to_tensor_pos(loc,board),workingMoves)
+
+    #Returns (loc,workingMoves) for each location that iterLadders should call f on, in the same order
+    def findLadders(self, board):
+        laddered_locs = []
         chainHeadsSolved = {}
         copy = board.copy()
 
@@ -66,7 +130,6 @@ class Features:
 
         for y in range(y_size):
             for x in range(x_size):
-                pos = self.xy_to_tensor_pos(x,y)
                 loc = board.loc(x,y)
                 stone = board.board[loc]
 
@@ -77,7 +140,7 @@ class Features:
                         if head in chainHeadsSolved:
                             laddered = chainHeadsSolved[head]
                             if laddered:
-                                f(loc,pos,[])
+                                laddered_locs.append((loc,[]))
                         else:
                             #Perform search on copy so as not to mess up tracking of solved heads
                             if libs == 1:
@@ -89,8 +152,50 @@ class Features:
 
                             chainHeadsSolved[head] = laddered
                             if laddered:
-                                f(loc,pos,workingMoves)
+                                laddered_locs.append((loc,workingMoves))
+
+        return laddered_locs
+
+
+    #Returns the owner of every loc for the area features under rules, or 0
+    def calculate_area(self,board,rules):
+        area = [0 for i in range(board.arrsize)]
+
+        if rules["scoringRule"] == "SCORING_AREA" and rules["taxRule"] == "TAX_NONE":
+            safeBigTerritories = True
+            nonPassAliveStones = True
+            unsafeBigTerritories = True
+            board.calculateArea(area,nonPassAliveStones,safeBigTerritories,unsafeBigTerritories,rules["multiStoneSuicideLegal"])
+        else:
+            hasAreaFeature = False
+            keepTerritories = False
+            keepStones = False
+            if rules["scoringRule"] == "SCORING_AREA" and (rules["taxRule"] == "TAX_SEKI" or rules["taxRule"] == "TAX_ALL"):
+                hasAreaFeature = True
+                keepTerritories = False
+                keepStones = True
+            elif rules["scoringRule"] == "SCORING_TERRITORY" and rules["taxRule"] == "TAX_NONE":
+                if rules["encorePhase"] >= 2:
+                    hasAreaFeature = True
+                    keepTerritories = True
+                    keepStones = False
+            elif rules["scoringRule"] == "SCORING_TERRITORY" and (rules["taxRule"] == "TAX_SEKI" or rules["taxRule"] == "TAX_ALL"):
+                if rules["encorePhase"] >= 2:
+                    hasAreaFeature = True
+                    keepTerritories = False
+                    keepStones = False
+            else:
+                assert(False)
+
+            if hasAreaFeature:
+                board.calculateNonDameTouchingArea(
+                    area,
+                    keepTerritories,
+                    keepStones,
+                    rules["multiStoneSuicideLegal"]
+                )
 
+        return area
 
     #Returns the new idx, which could be the same as idx if this isn't a good training row
     def fill_row_features(self, board, pla, opp, boards, moves, move_idx, rules, bin_input_data, global_input_data, idx):
@@ -103,25 +208,18 @@ class Features:
         assert(len(boards) > 0)
         assert(board.zobrist == boards[move_idx].zobrist)
 
-        for y in range(y_size):
-            for x in range(x_size):
-                pos = self.xy_to_tensor_pos(x,y)
-                bin_input_data[idx,pos,0] = 1.0
-                loc = board.loc(x,y)
-                stone = board.board[loc]
-                if stone == pla:
-                    bin_input_data[idx,pos,1] = 1.0
-                elif stone == opp:
-                    bin_input_data[idx,pos,2] = 1.0
+        locs, poss = self.loc_pos_map(board)
+        stones = board.board[locs]
+        is_pla = stones == pla
+        is_opp = stones == opp
+        libs = np.where(is_pla | is_opp, board.group_liberty_count[board.group_head[locs]], 0)
 
-                if stone == pla or stone == opp:
-                    libs = board.num_liberties(loc)
-                    if libs == 1:
-                        bin_input_data[idx,pos,3] = 1.0
-                    elif libs == 2:
-                        bin_input_data[idx,pos,4] = 1.0
-                    elif libs == 3:
-                        bin_input_data[idx,pos,5] = 1.0
+        bin_input_data[idx,poss,0] = 1.0
+        bin_input_data[idx,poss[is_pla],1] = 1.0
+        bin_input_data[idx,poss[is_opp],2] = 1.0
+        bin_input_data[idx,poss[libs == 1],3] = 1.0
+        bin_input_data[idx,poss[libs == 2],4] = 1.0
+        bin_input_data[idx,poss[libs == 3],5] = 1.0
 
         #Python code does NOT handle superko
         if board.simple_ko_point is not None:
@@ -199,64 +297,15 @@ class Features:
         self.iterLadders(prevPrevBoard, addPrevPrevLadderFeature)
 
         #Features 18,19 - area
-        area = [0 for i in range(board.arrsize)]
-
-        if rules["scoringRule"] == "SCORING_AREA" and rules["taxRule"] == "TAX_NONE":
-            safeBigTerritories = True
-            nonPassAliveStones = True
-            unsafeBigTerritories = True
-            board.calculateArea(area,nonPassAliveStones,safeBigTerritories,unsafeBigTerritories,rules["multiStoneSuicideLegal"])
-        else:
-            hasAreaFeature = False
-            keepTerritories = False
-            keepStones = False
-            if rules["scoringRule"] == "SCORING_AREA" and (rules["taxRule"] == "TAX_SEKI" or rules["taxRule"] == "TAX_ALL"):
-                hasAreaFeature = True
-                keepTerritories = False
-                keepStones = True
-            elif rules["scoringRule"] == "SCORING_TERRITORY" and rules["taxRule"] == "TAX_NONE":
-                if rules["encorePhase"] >= 2:
-                    hasAreaFeature = True
-                    keepTerritories = True
-                    keepStones = False
-            elif rules["scoringRule"] == "SCORING_TERRITORY" and (rules["taxRule"] == "TAX_SEKI" or rules["taxRule"] == "TAX_ALL"):
-                if rules["encorePhase"] >= 2:
-                    hasAreaFeature = True
-                    keepTerritories = False
-                    keepStones = False
-            else:
-                assert(False)
-
-            if hasAreaFeature:
-                board.calculateNonDameTouchingArea(
-                    area,
-                    keepTerritories,
-                    keepStones,
-                    rules["multiStoneSuicideLegal"]
-                )
-
-        for y in range(y_size):
-            for x in range(x_size):
-                loc = board.loc(x,y)
-                pos = self.xy_to_tensor_pos(x,y)
-
-                if area[loc] == pla:
-                    bin_input_data[idx,pos,18] = 1.0
-                elif area[loc] == opp:
-                    bin_input_data[idx,pos,19] = 1.0
+        area = np.asarray(self.calculate_area(board,rules))[locs]
+        bin_input_data[idx,poss[area == pla],18] = 1.0
+        bin_input_data[idx,poss[area == opp],19] = 1.0
 
         #Features 20,21 - second encore phase starting stones, we just set them to the current stones in pythong
         #since we don't really have a jp rules impl
         if rules["encorePhase"] >= 2:
-            for y in range(y_size):
-                for x in range(x_size):
-                    pos = self.xy_to_tensor_pos(x,y)
-                    loc = board.loc(x,y)
-                    stone = board.board[loc]
-                    if stone == pla:
-                        bin_input_data[idx,pos,20] = 1.0
-                    elif stone == opp:
-                        bin_input_data[idx,pos,21] = 1.0
+            bin_input_data[idx,poss[is_pla],20] = 1.0
+            bin_input_data[idx,poss[is_opp],21] = 1.0
 
         bArea = board.y_size * board.x_size
         whiteKomi = rules["whiteKomi"]
@@ -313,7 +362,7 @@ class Features:
         global_input_data[idx,15] = 1.0 if rules["asymPowersOfTwo"] != 0 else 0.0
         global_input_data[idx,16] = rules["asymPowersOfTwo"]
 
-        if "hasButton" in rules and rules["hasButton"] and Board.PASS_LOC not in [move[1] for move in moves]:
+        if "hasButton" in rules and rules["hasButton"] and Board.PASS_LOC not in [move[1] for move in moves[:move_idx]]:
             global_input_data[idx,17] = 1.0
 
         if rules["scoringRule"] == "SCORING_AREA" or rules["encorePhase"] > 1:
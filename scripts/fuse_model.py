@@ -0,0 +1,108 @@
+import torch
+
+from model_pytorch import NormMask, BiasMask, NormActConv, KataConvAndGPool, ResBlock, BottleneckResBlock, PolicyHead, ValueHead
+
+class ScaleBiasMask(torch.nn.Module):
+    """What a NormMask or BiasMask computes at inference time, (x * scale + bias) * mask, with the scale and bias
+    precomputed per channel. Either may be None once it has been folded into a convolution, and mask is None
+    on the full-board path."""
+
+    def __init__(self, scale, bias):
+        super(ScaleBiasMask, self).__init__()
+        self.register_buffer("scale", None if scale is None else scale.reshape(1, -1, 1, 1).clone())
+        self.register_buffer("bias", None if bias is None else bias.reshape(1, -1, 1, 1).clone())
+
+    def forward(self, x, mask, mask_sum: float):
+        if self.scale is not None and self.bias is not None:
+            x = torch.addcmul(self.bias, x, self.scale)
+        elif self.scale is not None:
+            x = x * self.scale
+        elif self.bias is not None:
+            x = x + self.bias
+        if mask is None:
+            return x
+        return x * mask
+
+def get_scale_and_bias(norm):
+    """The per-channel scale and bias a NormMask or BiasMask in eval mode applies before masking."""
+    c = norm.c_in
+    scale = torch.ones(c, device=norm.beta.device)
+    if getattr(norm, "gamma", None) is not None:
+        scale = scale * norm.gamma.detach().reshape(c)
+    if norm.scale is not None:
+        scale = scale * norm.scale
+    bias = norm.beta.detach().reshape(c)
+    if isinstance(norm, NormMask) and norm.is_using_batchnorm:
+        # (x - running_mean) / running_std * scale + bias
+        scale = scale / norm.running_std
+        bias = bias - norm.running_mean * scale
+    return scale, bias
+
+def fold_into(conv, linears, scale, bias):
+    """Makes conv(x) + linear(g) for each of linears equal to (conv(x) + linear(g)) * scale + bias, per output channel."""
+    conv.weight.data *= scale.reshape(-1, 1, 1, 1)
+    for linear in linears:
+        linear.weight.data *= scale.reshape(-1, 1)
+    if conv.bias is not None:
+        bias = bias + conv.bias.detach() * scale
+    conv.bias = torch.nn.Parameter(bias.clone(), requires_grad=False)
+
+def merge_repvgg_conv1x1(normactconv):
+    """Adds the parallel 1x1 convolution of a NormActConv into the center of its 3x3 convolution."""
+    center = normactconv.conv.kernel_size[0] // 2
+    normactconv.conv.weight.data[:, :, center, center] += normactconv.conv1x1.weight.detach()[:, :, 0, 0]
+    normactconv.conv1x1 = None
+
+def fold_norm_into_normactconv(previous, following):
+    """Folds the norm of following into the convolution of previous, whose output is its only input."""
+    scale, bias = get_scale_and_bias(following.norm)
+    if previous.convpool is None:
+        fold_into(previous.conv, [], scale, bias)
+    elif isinstance(previous.convpool, KataConvAndGPool):
+        fold_into(previous.convpool.conv1r, [previous.convpool.linear_g], scale, bias)
+    else:
+        return
+    following.norm = ScaleBiasMask(None, None)
+
+def fuse_for_inference(model, channels_last=True):
+    """Transforms a loaded model for inference only, in place:
+    the parallel 1x1 convolutions of repvgg blocks are merged into their 3x3 convolutions, NormMasks and BiasMasks
+    that directly follow a convolution are folded into its weights and bias, the other ones become a single
+    precomputed scale and bias, and with channels_last, convolutions run in channels-last memory format.
+    Outputs stay the same within float tolerance. Extra outputs of folded convolutions report the normalized values.
+    """
+    model.eval()
+    with torch.no_grad():
+        for module in list(model.modules()):
+            if isinstance(module, NormActConv) and module.conv1x1 is not None:
+                merge_repvgg_conv1x1(module)
+
+        for module in list(model.modules()):
+            if isinstance(module, ResBlock):
+                fold_norm_into_normactconv(module.normactconv1, module.normactconv2)
+            elif isinstance(module, BottleneckResBlock):
+                chain = [module.normactconvp] + list(module.normactconvstack) + [module.normactconvq]
+                for previous, following in zip(chain[:-1], chain[1:]):
+                    fold_norm_into_normactconv(previous, following)
+            elif isinstance(module, KataConvAndGPool):
+                fold_into(module.conv1g, [], *get_scale_and_bias(module.normg))
+                module.normg = ScaleBiasMask(None, None)
+            elif isinstance(module, PolicyHead):
+                fold_into(module.conv1g, [], *get_scale_and_bias(module.biasg))
+                module.biasg = ScaleBiasMask(None, None)
+                fold_into(module.conv1p, [module.linear_g], *get_scale_and_bias(module.bias2))
+                module.bias2 = ScaleBiasMask(None, None)
+            elif isinstance(module, ValueHead):
+                fold_into(module.conv1, [], *get_scale_and_bias(module.bias1))
+                module.bias1 = ScaleBiasMask(None, None)
+
+        # The norms left, such as the ones on the residual trunk, follow a sum rather than a convolution
+        for parent in list(model.modules()):
+            for name, child in list(parent.named_children()):
+                if isinstance(child, (NormMask, BiasMask)):
+                    scale, bias = get_scale_and_bias(child)
+                    setattr(parent, name, ScaleBiasMask(None if torch.all(scale == 1.0) else scale, bias))
+
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
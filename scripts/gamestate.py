@@ -1,16 +1,203 @@
 
 from typing import Dict, Any, List, Tuple, Union, Optional, TYPE_CHECKING
+from collections import OrderedDict
+import dataclasses
 import math
 
 import numpy as np
 
 from board import Board
-from features import Features
+from features import Features, LadderCache
 from sgfmetadata import SGFMetadata
 
 if TYPE_CHECKING:
     from model_pytorch import Model
 
+class BoardHistory:
+    """The boards before and after each move of a game, indexed like a list of boards.
+
+    Instead of a copy of every board, this keeps a snapshot every snapshot_interval moves and replays
+    the moves from the nearest snapshot, or from a recently replayed board, when another board is asked for.
+    The last board is the live board of the GameState.
+    """
+
+    def __init__(self, board: Board, moves: List[Tuple[int,int]], snapshot_interval: int = 16, max_recent: int = 4):
+        self.board = board
+        self.moves = moves
+        self.snapshot_interval = snapshot_interval
+        self.max_recent = max_recent
+        self.snapshots = {0: board.copy()}
+        self.recent = OrderedDict()
+
+    def __len__(self):
+        return len(self.moves) + 1
+
+    def __getitem__(self, idx: int) -> Board:
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("Board history index out of range")
+        if idx == len(self.moves):
+            return self.board
+        if idx in self.snapshots:
+            return self.snapshots[idx]
+        if idx in self.recent:
+            self.recent.move_to_end(idx)
+            return self.recent[idx]
+
+        start = idx - idx % self.snapshot_interval
+        for recent_idx in self.recent:
+            if start < recent_idx < idx:
+                start = recent_idx
+        board = (self.snapshots[start] if start in self.snapshots else self.recent[start]).copy()
+        for pla, loc in self.moves[start:idx]:
+            board.playUnsafe(pla,loc)
+
+        self.recent[idx] = board
+        while len(self.recent) > self.max_recent:
+            self.recent.popitem(last=False)
+        return board
+
+    def after_play(self):
+        move_idx = len(self.moves)
+        if move_idx % self.snapshot_interval == 0:
+            self.snapshots[move_idx] = self.board.copy()
+
+    def after_undo(self):
+        move_idx = len(self.moves)
+        for idx in [idx for idx in self.snapshots if idx > move_idx]:
+            del self.snapshots[idx]
+        for idx in [idx for idx in self.recent if idx > move_idx]:
+            del self.recent[idx]
+
+class MetadataCache:
+    """Remembers metadata rows, and the model's metadata encoder output for them.
+
+    Both depend only on the SGFMetadata, the player to move and the board area, which rarely change during
+    a review, so each distinct setting is built and encoded once instead of once per position.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.rows = OrderedDict()
+        self.encodings = OrderedDict()
+
+    def key(self, sgfmeta: SGFMetadata, pla: int, area: int):
+        return (tuple(getattr(sgfmeta, field.name) for field in dataclasses.fields(sgfmeta)), pla, area)
+
+    def remember(self, entries: OrderedDict, key, value):
+        entries[key] = value
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_row(self, sgfmeta: SGFMetadata, pla: int, area: int) -> np.ndarray:
+        key = self.key(sgfmeta, pla, area)
+        row = self.rows.get(key)
+        if row is None:
+            row = sgfmeta.get_metadata_row(nextPlayer=pla, boardArea=area)
+            self.remember(self.rows, key, row)
+        else:
+            self.rows.move_to_end(key)
+        return row
+
+    def get_encoded(self, model: "Model", settings: List[Tuple[SGFMetadata,int,int]]):
+        """Returns the metadata encoder output for each (sgfmeta, pla, area), encoding the settings not seen before in one batch."""
+        import torch
+        # Batches usually share a few SGFMetadata objects, so only build the key of each once
+        keys_by_object = {}
+        keys = []
+        for sgfmeta, pla, area in settings:
+            object_key = (id(sgfmeta), pla, area)
+            if object_key not in keys_by_object:
+                keys_by_object[object_key] = (model, self.key(sgfmeta, pla, area))
+            keys.append(keys_by_object[object_key])
+        missing = {}
+        for key, setting in zip(keys, settings):
+            if key in self.encodings:
+                self.encodings.move_to_end(key)
+            elif key not in missing:
+                missing[key] = setting
+
+        if missing:
+            rows = np.array([self.get_row(*setting) for setting in missing.values()])
+            encoded = model.metadata_encoder(torch.tensor(rows, dtype=torch.float32, device=model.device), None)
+            for key, encoding in zip(missing.keys(), encoded):
+                self.remember(self.encodings, key, encoding)
+
+        return torch.stack([self.encodings[key] for key in keys])
+
+# Shared by all game states, since the encodings are the same for every game
+METADATA_CACHE = MetadataCache()
+
+# Symmetries are numbered like Features.sym_tensor_pos: 4 transposes, then 2 mirrors x, then 1 mirrors y
+NUM_SYMMETRIES = 8
+
+def apply_symmetry(tensor, symmetry: int):
+    """Transforms the last two (y, x) dimensions of tensor by symmetry."""
+    if symmetry & 4:
+        tensor = tensor.transpose(-1, -2)
+    if symmetry & 2:
+        tensor = tensor.flip(-1)
+    if symmetry & 1:
+        tensor = tensor.flip(-2)
+    return tensor
+
+def apply_inverse_symmetry(tensor, symmetry: int):
+    if symmetry & 1:
+        tensor = tensor.flip(-2)
+    if symmetry & 2:
+        tensor = tensor.flip(-1)
+    if symmetry & 4:
+        tensor = tensor.transpose(-1, -2)
+    return tensor
+
+def average_symmetries(outputs, symmetries: List[int], pos_len: int):
+    """Averages postprocessed model outputs of a batch evaluated under each of symmetries in turn, each symmetry
+    being a block of rows, into outputs of the untransformed batch. Spatial outputs are transformed back first.
+    Probabilities (policy0, policy1, value, td_value and scorebelief) are averaged rather than their logits,
+    and returned as the log of the average, so softmax still turns them into probabilities."""
+    import torch
+    num_symmetries = len(symmetries)
+
+    def unstack(tensor):
+        return tensor.reshape((num_symmetries, tensor.shape[0] // num_symmetries) + tuple(tensor.shape[1:]))
+
+    def untransform(spatial):
+        return torch.stack([apply_inverse_symmetry(spatial[i], symmetry) for i, symmetry in enumerate(symmetries)])
+
+    def mean_of_probs(logits):
+        return torch.logsumexp(torch.log_softmax(logits, dim=-1), dim=0) - math.log(num_symmetries)
+
+    averaged_heads = []
+    for head in outputs:
+        (
+            policy_logits, value_logits, td_value_logits, pred_td_score, ownership_pretanh, pred_scoring, futurepos_pretanh, seki_logits,
+            pred_scoremean, pred_scorestdev, pred_lead, pred_variance_time, pred_shortterm_value_error, pred_shortterm_score_error, scorebelief_logits,
+        ) = (unstack(x) for x in head)
+
+        board_policy = untransform(policy_logits[:,:,:,:pos_len*pos_len].reshape(policy_logits.shape[:3] + (pos_len, pos_len)))
+        policy_logits = torch.cat([board_policy.flatten(-2), policy_logits[:,:,:,pos_len*pos_len:]], dim=-1)
+        policy_logits = torch.cat([mean_of_probs(policy_logits[:,:,:2]), policy_logits[:,:,2:].mean(dim=0)], dim=1)
+
+        averaged_heads.append((
+            policy_logits,
+            mean_of_probs(value_logits),
+            mean_of_probs(td_value_logits),
+            pred_td_score.mean(dim=0),
+            untransform(ownership_pretanh).mean(dim=0),
+            untransform(pred_scoring).mean(dim=0),
+            untransform(futurepos_pretanh).mean(dim=0),
+            untransform(seki_logits).mean(dim=0),
+            pred_scoremean.mean(dim=0),
+            pred_scorestdev.mean(dim=0),
+            pred_lead.mean(dim=0),
+            pred_variance_time.mean(dim=0),
+            pred_shortterm_value_error.mean(dim=0),
+            pred_shortterm_score_error.mean(dim=0),
+            mean_of_probs(scorebelief_logits),
+        ))
+    return tuple(averaged_heads)
+
 class GameState:
     RULES_TT = {
         "koRule": "KO_POSITIONAL",
@@ -46,21 +233,35 @@ class GameState:
         "asymPowersOfTwo": 0.0,
     }
 
+    # What get_model_outputs can return besides the requested extra outputs, in the order it returns them
+    OUTPUT_NAMES = [
+        "policy0", "policy1", "moves_and_probs0", "moves_and_probs1", "top_move0",
+        "value", "td_value", "td_value2", "td_value3", "scoremean", "td_score", "scorestdev", "lead", "vtime", "estv", "ests",
+        "ownership", "ownership_by_loc", "scoring", "scoring_by_loc", "futurepos", "futurepos0_by_loc", "futurepos1_by_loc",
+        "seki", "seki_by_loc", "seki2", "seki_by_loc2", "scorebelief", "qwinloss", "qscore", "genmove_result",
+    ]
 
     def __init__(self, board_size: Union[int,Tuple[int,int]], rules: Dict[str,Any]):
         self.board_size = board_size
         self.board = Board(size=board_size)
         self.moves = []
-        self.boards = [self.board.copy()]
+        # The player to move before each move and the record from Board.playRecordedUnsafe for it, so undo doesn't
+        # need a copy of the previous board. Board.undo gives the move to the player of the undone move, which is
+        # wrong after consecutive moves of the same color, such as setup stones
+        self.records = []
+        self.boards = BoardHistory(self.board, self.moves)
         self.rules = rules.copy()
         self.redo_stack = []
+        self.ladder_cache = LadderCache()
 
     def play(self, pla, loc):
-        self.board.play(pla,loc)
+        prev_pla = self.board.pla
+        record = self.board.playRecorded(pla,loc)
         self.moves.append((pla,loc))
-        self.boards.append(self.board.copy())
+        self.records.append((prev_pla, record))
+        self.boards.after_play()
         if len(self.redo_stack) > 0:
-            move, _ = self.redo_stack[-1]
+            move = self.redo_stack[-1]
             if move == (pla,loc):
                 self.redo_stack.pop()
             else:
@@ -72,65 +273,176 @@ class GameState:
     def undo(self):
         assert self.can_undo()
         move = self.moves.pop()
-        board = self.boards.pop()
-        self.board = self.boards[-1].copy()
-        self.redo_stack.append((move,board))
+        prev_pla, record = self.records.pop()
+        self.board.undo(record)
+        self.board.set_pla(prev_pla)
+        self.boards.after_undo()
+        self.redo_stack.append(move)
+
+    def set_moves(self, moves: List[Tuple[int,int]]):
+        """Changes the position to the one after moves, only undoing and playing from where the move lists differ."""
+        common = 0
+        while common < min(len(self.moves), len(moves)) and self.moves[common] == tuple(moves[common]):
+            common += 1
+        while len(self.moves) > common:
+            self.undo()
+        for pla, loc in moves[common:]:
+            self.play(pla, loc)
 
     def can_redo(self) -> bool:
         return len(self.redo_stack) > 0
 
     def redo(self):
         assert self.can_redo()
-        move, board = self.redo_stack.pop()
-        self.moves.append(move)
-        self.boards.append(board)
-        self.board = self.boards[-1].copy()
-
-    def get_input_features(self, features: Features):
-        bin_input_data = np.zeros(shape=[1]+features.bin_input_shape, dtype=np.float32)
-        global_input_data = np.zeros(shape=[1]+features.global_input_shape, dtype=np.float32)
+        pla, loc = self.redo_stack.pop()
+        prev_pla = self.board.pla
+        self.records.append((prev_pla, self.board.playRecordedUnsafe(pla,loc)))
+        self.moves.append((pla,loc))
+        self.boards.after_play()
+
+    def get_input_features(self, features: Features, move_indices: Optional[List[int]] = None):
+        """Features of the positions before moves[move_idx] for each move_idx, by default only the current position."""
+        if move_indices is None:
+            move_indices = [len(self.moves)]
+        batch_size = len(move_indices)
+        bin_input_data = np.zeros(shape=[batch_size]+features.bin_input_shape, dtype=np.float32)
+        global_input_data = np.zeros(shape=[batch_size]+features.global_input_shape, dtype=np.float32)
         pos_len = features.pos_len
-        pla = self.board.pla
-        opp = Board.get_opp(pla)
-        move_idx = len(self.moves)
         # fill_row_features assumes N(HW)C order but we actually use NCHW order in the model, so work with it and revert
         bin_input_data = np.transpose(bin_input_data,axes=(0,2,3,1))
-        bin_input_data = bin_input_data.reshape([1,pos_len*pos_len,-1])
-        features.fill_row_features(self.board,pla,opp,self.boards,self.moves,move_idx,self.rules,bin_input_data,global_input_data,idx=0)
-        bin_input_data = bin_input_data.reshape([1,pos_len,pos_len,-1])
+        bin_input_data = bin_input_data.reshape([batch_size,pos_len*pos_len,-1])
+        for idx, move_idx in enumerate(move_indices):
+            board = self.boards[move_idx]
+            pla = board.pla
+            opp = Board.get_opp(pla)
+            features.fill_row_features(board,pla,opp,self.boards,self.moves,move_idx,self.rules,bin_input_data,global_input_data,idx=idx)
+        bin_input_data = bin_input_data.reshape([batch_size,pos_len,pos_len,-1])
         bin_input_data = np.transpose(bin_input_data,axes=(0,3,1,2))
         return bin_input_data, global_input_data
 
-    def get_model_outputs(self, model: "Model", sgfmeta: Optional[SGFMetadata] = None, extra_output_names: List[str] = []):
+    def get_model_outputs(self, model: "Model", sgfmeta: Optional[SGFMetadata] = None, extra_output_names: List[str] = [], output_names: Optional[List[str]] = None, symmetries: Optional[List[int]] = None):
+        return self.get_model_outputs_batch(model, [len(self.moves)], sgfmeta=sgfmeta, extra_output_names=extra_output_names, output_names=output_names, symmetries=symmetries)[0]
+
+    def get_model_outputs_batch(
+        self,
+        model: "Model",
+        move_indices: Optional[List[int]] = None,
+        sgfmeta: Optional[Union[SGFMetadata,List[SGFMetadata]]] = None,
+        max_batch_size: Optional[int] = None,
+        extra_output_names: List[str] = [],
+        output_names: Optional[List[str]] = None,
+        symmetries: Optional[List[int]] = None,
+    ):
+        """Evaluates the positions before moves[move_idx] for each move_idx, by default every position of the game.
+        Positions are stacked into batches of at most max_batch_size so each batch is a single forward pass.
+        With output_names (from OUTPUT_NAMES and "available_extra_outputs"), only those outputs are computed and returned.
+        sgfmeta may also be a list with one SGFMetadata per move index, for example to evaluate a position at several ranks.
+        With symmetries (numbers below NUM_SYMMETRIES), every position is evaluated under each of them in the same forward pass
+        and the outputs are averaged, see average_symmetries. Extra outputs come from the first symmetry."""
+        if output_names is not None:
+            unknown_names = [name for name in output_names if name not in GameState.OUTPUT_NAMES and name != "available_extra_outputs"]
+            if unknown_names:
+                raise ValueError(f"Unknown output names: {unknown_names}")
+        if move_indices is None:
+            move_indices = list(range(len(self.moves)+1))
+        if max_batch_size is None or max_batch_size <= 0:
+            max_batch_size = max(len(move_indices),1)
+
+        sgfmetas = None
+        if isinstance(sgfmeta, list):
+            assert len(sgfmeta) == len(move_indices)
+            sgfmetas = sgfmeta
+        elif sgfmeta is not None:
+            sgfmetas = [sgfmeta] * len(move_indices)
+
+        results = []
+        for start in range(0, len(move_indices), max_batch_size):
+            batch_sgfmetas = sgfmetas[start:start+max_batch_size] if sgfmetas is not None else None
+            results.extend(self.get_model_outputs_of_indices(model, move_indices[start:start+max_batch_size], batch_sgfmetas, extra_output_names, output_names, symmetries))
+        return results
+
+    def get_model_outputs_of_indices(
+        self,
+        model: "Model",
+        move_indices: List[int],
+        sgfmetas: Optional[List[SGFMetadata]],
+        extra_output_names: List[str],
+        output_names: Optional[List[str]] = None,
+        symmetries: Optional[List[int]] = None,
+    ):
         import torch
         from model_pytorch import Model, ExtraOutputs
         with torch.no_grad():
             model.eval()
-            features = Features(model.config, model.pos_len)
-
-            bin_input_data, global_input_data = self.get_input_features(features)
-            # Currently we don't actually do any symmetries
-            # symmetry = 0
-            # model_outputs = model(apply_symmetry(batch["binaryInputNCHW"],symmetry),batch["globalInputNC"])
-
-            input_meta = None
-            if sgfmeta is not None:
-                metarow = sgfmeta.get_metadata_row(nextPlayer=self.board.pla, boardArea=self.board.x_size*self.board.y_size)
-                input_meta = torch.tensor(metarow, dtype=torch.float32, device=model.device)
-                input_meta = input_meta.reshape([1,-1])
+            features = Features(model.config, model.pos_len, ladder_cache=self.ladder_cache)
+
+            # A position may be repeated with different metadata, its features only need to be computed once
+            unique_indices = list(dict.fromkeys(move_indices))
+            bin_input_data, global_input_data = self.get_input_features(features, unique_indices)
+            if len(unique_indices) < len(move_indices):
+                row_of_index = {move_idx: row for row, move_idx in enumerate(unique_indices)}
+                rows = [row_of_index[move_idx] for move_idx in move_indices]
+                bin_input_data = bin_input_data[rows]
+                global_input_data = global_input_data[rows]
+
+            input_meta_encoded = None
+            if sgfmetas is not None and model.metadata_encoder is not None:
+                settings = []
+                for move_idx, sgfmeta in zip(move_indices, sgfmetas):
+                    board = self.boards[move_idx]
+                    settings.append((sgfmeta, board.pla, board.x_size*board.y_size))
+                input_meta_encoded = METADATA_CACHE.get_encoded(model, settings)
 
             extra_outputs = ExtraOutputs(extra_output_names)
 
+            input_spatial = torch.tensor(bin_input_data, dtype=torch.float32, device=model.device)
+            input_global = torch.tensor(global_input_data, dtype=torch.float32, device=model.device)
+            use_symmetries = symmetries is not None and list(symmetries) != [0]
+            if use_symmetries:
+                # One block of rows per symmetry, so the whole ensemble is one forward pass
+                input_spatial = torch.cat([apply_symmetry(input_spatial, symmetry) for symmetry in symmetries])
+                input_global = input_global.repeat(len(symmetries), 1)
+                if input_meta_encoded is not None:
+                    input_meta_encoded = input_meta_encoded.repeat(len(symmetries), 1)
+
+            # Boards that fill pos_len have nothing off the board to mask out
+            full_board = all(
+                self.boards[move_idx].x_size == model.pos_len and self.boards[move_idx].y_size == model.pos_len
+                for move_idx in unique_indices
+            )
             model_outputs = model(
-                torch.tensor(bin_input_data, dtype=torch.float32, device=model.device),
-                torch.tensor(global_input_data, dtype=torch.float32, device=model.device),
-                input_meta = input_meta,
+                input_spatial,
+                input_global,
                 extra_outputs=extra_outputs,
+                input_meta_encoded=input_meta_encoded,
+                full_board=full_board,
             )
 
             available_extra_outputs = extra_outputs.available
 
             outputs = model.postprocess_output(model_outputs)
+            if use_symmetries:
+                outputs = average_symmetries(outputs, symmetries, model.pos_len)
+
+        # Transpose attention so that both it and reverse attention are in n c (hw) format.
+        for name in list(extra_outputs.returned.keys()):
+            if name.endswith(".attention"):
+                extra_outputs.returned[name] = torch.transpose(extra_outputs.returned[name],1,2)
+
+        return [
+            self.get_outputs_of_row(model, features, outputs, extra_outputs, available_extra_outputs, n, move_idx, output_names)
+            for n, move_idx in enumerate(move_indices)
+        ]
+
+    def get_outputs_of_row(self, model: "Model", features: Features, outputs, extra_outputs, available_extra_outputs, n: int, move_idx: int, output_names: Optional[List[str]] = None):
+        import torch
+        board = self.boards[move_idx]
+
+        def wanted(*names):
+            return output_names is None or any(name in output_names for name in names)
+
+        row = {}
+        with torch.no_grad():
             (
                 policy_logits,      # N, num_policy_outputs, move
                 value_logits,       # N, {win,loss,noresult}
@@ -147,177 +459,125 @@ class GameState:
                 pred_shortterm_value_error, # N
                 pred_shortterm_score_error, # N
                 scorebelief_logits, # N, 2 * (self.pos_len*self.pos_len + EXTRA_SCORE_DISTR_RADIUS)
-            ) = (x[0] for x in outputs[0]) # N = 0
-
-            policy0 = torch.nn.functional.softmax(policy_logits[0,:],dim=0).cpu().numpy()
-            policy1 = torch.nn.functional.softmax(policy_logits[1,:],dim=0).cpu().numpy()
-            value = torch.nn.functional.softmax(value_logits,dim=0).cpu().numpy()
-            td_value = torch.nn.functional.softmax(td_value_logits[0,:],dim=0).cpu().numpy()
-            td_value2 = torch.nn.functional.softmax(td_value_logits[1,:],dim=0).cpu().numpy()
-            td_value3 = torch.nn.functional.softmax(td_value_logits[2,:],dim=0).cpu().numpy()
-            scoremean = pred_scoremean.cpu().item()
-            td_score = pred_td_score.cpu().numpy()
-            scorestdev = pred_scorestdev.cpu().item()
-            lead = pred_lead.cpu().item()
-            vtime = pred_variance_time.cpu().item()
-            estv = math.sqrt(pred_shortterm_value_error.cpu().item())
-            ests = math.sqrt(pred_shortterm_score_error.cpu().item())
-            ownership = torch.tanh(ownership_pretanh).cpu().numpy()
-            scoring = pred_scoring.cpu().numpy()
-            futurepos = torch.tanh(futurepos_pretanh).cpu().numpy()
-            seki_probs = torch.nn.functional.softmax(seki_logits[0:3,:,:],dim=0).cpu().numpy()
-            seki = seki_probs[1] - seki_probs[2]
-            seki2 = torch.sigmoid(seki_logits[3,:,:]).cpu().numpy()
-            scorebelief = torch.nn.functional.softmax(scorebelief_logits,dim=0).cpu().numpy()
-            if model.config["version"] >= 16:
-                qwinloss = torch.tanh(policy_logits[6,:]).cpu().numpy()
-                qscore = (policy_logits[7,:] * model.scoremean_multiplier).cpu().numpy()
-            else:
-                qwinloss = torch.zeros_like(policy_logits[0,:]).cpu().numpy()
-                qscore = torch.zeros_like(policy_logits[0,:]).cpu().numpy()
-
-
-        board = self.board
-
-        moves_and_probs0 = []
-        for i in range(len(policy0)):
-            move = features.tensor_pos_to_loc(i,board)
-            if i == len(policy0)-1:
-                moves_and_probs0.append((Board.PASS_LOC,policy0[i]))
-            elif board.would_be_legal(board.pla,move):
-                moves_and_probs0.append((move,policy0[i]))
-
-        moves_and_probs1 = []
-        for i in range(len(policy1)):
-            move = features.tensor_pos_to_loc(i,board)
-            if i == len(policy1)-1:
-                moves_and_probs1.append((Board.PASS_LOC,policy1[i]))
-            elif board.would_be_legal(board.pla,move):
-                moves_and_probs1.append((move,policy1[i]))
-
-        ownership_flat = ownership.reshape([features.pos_len * features.pos_len])
-        ownership_by_loc = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                if board.pla == Board.WHITE:
-                    ownership_by_loc.append((loc,ownership_flat[pos]))
-                else:
-                    ownership_by_loc.append((loc,-ownership_flat[pos]))
-
-        scoring_flat = scoring.reshape([features.pos_len * features.pos_len])
-        scoring_by_loc = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                if board.pla == Board.WHITE:
-                    scoring_by_loc.append((loc,scoring_flat[pos]))
-                else:
-                    scoring_by_loc.append((loc,-scoring_flat[pos]))
-
-        futurepos0_flat = futurepos[0,:,:].reshape([features.pos_len * features.pos_len])
-        futurepos0_by_loc = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                if board.pla == Board.WHITE:
-                    futurepos0_by_loc.append((loc,futurepos0_flat[pos]))
+            ) = (x[n] for x in outputs[0])
+
+            if wanted("policy0", "moves_and_probs0", "top_move0", "genmove_result"):
+                row["policy0"] = policy0 = torch.nn.functional.softmax(policy_logits[0,:],dim=0).cpu().numpy()
+            if wanted("policy1", "moves_and_probs1"):
+                row["policy1"] = policy1 = torch.nn.functional.softmax(policy_logits[1,:],dim=0).cpu().numpy()
+            if wanted("value"):
+                row["value"] = torch.nn.functional.softmax(value_logits,dim=0).cpu().numpy()
+            if wanted("td_value"):
+                row["td_value"] = torch.nn.functional.softmax(td_value_logits[0,:],dim=0).cpu().numpy()
+            if wanted("td_value2"):
+                row["td_value2"] = torch.nn.functional.softmax(td_value_logits[1,:],dim=0).cpu().numpy()
+            if wanted("td_value3"):
+                row["td_value3"] = torch.nn.functional.softmax(td_value_logits[2,:],dim=0).cpu().numpy()
+            if wanted("scoremean"):
+                row["scoremean"] = pred_scoremean.cpu().item()
+            if wanted("td_score"):
+                row["td_score"] = pred_td_score.cpu().numpy()
+            if wanted("scorestdev"):
+                row["scorestdev"] = pred_scorestdev.cpu().item()
+            if wanted("lead"):
+                row["lead"] = pred_lead.cpu().item()
+            if wanted("vtime"):
+                row["vtime"] = pred_variance_time.cpu().item()
+            if wanted("estv"):
+                row["estv"] = math.sqrt(pred_shortterm_value_error.cpu().item())
+            if wanted("ests"):
+                row["ests"] = math.sqrt(pred_shortterm_score_error.cpu().item())
+            if wanted("ownership", "ownership_by_loc"):
+                row["ownership"] = torch.tanh(ownership_pretanh).cpu().numpy()
+            if wanted("scoring", "scoring_by_loc"):
+                row["scoring"] = pred_scoring.cpu().numpy()
+            if wanted("futurepos", "futurepos0_by_loc", "futurepos1_by_loc"):
+                row["futurepos"] = torch.tanh(futurepos_pretanh).cpu().numpy()
+            if wanted("seki", "seki_by_loc"):
+                seki_probs = torch.nn.functional.softmax(seki_logits[0:3,:,:],dim=0).cpu().numpy()
+                row["seki"] = seki_probs[1] - seki_probs[2]
+            if wanted("seki2", "seki_by_loc2"):
+                row["seki2"] = torch.sigmoid(seki_logits[3,:,:]).cpu().numpy()
+            if wanted("scorebelief"):
+                row["scorebelief"] = torch.nn.functional.softmax(scorebelief_logits,dim=0).cpu().numpy()
+            if wanted("qwinloss", "qscore"):
+                if model.config["version"] >= 16:
+                    qwinloss = torch.tanh(policy_logits[6,:]).cpu().numpy()
+                    qscore = (policy_logits[7,:] * model.scoremean_multiplier).cpu().numpy()
                 else:
-                    futurepos0_by_loc.append((loc,-futurepos0_flat[pos]))
-
-        futurepos1_flat = futurepos[1,:,:].reshape([features.pos_len * features.pos_len])
-        futurepos1_by_loc = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                if board.pla == Board.WHITE:
-                    futurepos1_by_loc.append((loc,futurepos1_flat[pos]))
-                else:
-                    futurepos1_by_loc.append((loc,-futurepos1_flat[pos]))
-
-        seki_flat = seki.reshape([features.pos_len * features.pos_len])
-        seki_by_loc = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                if board.pla == Board.WHITE:
-                    seki_by_loc.append((loc,seki_flat[pos]))
-                else:
-                    seki_by_loc.append((loc,-seki_flat[pos]))
-
-        seki_flat2 = seki2.reshape([features.pos_len * features.pos_len])
-        seki_by_loc2 = []
-        board = self.board
-        for y in range(board.y_size):
-            for x in range(board.x_size):
-                loc = board.loc(x,y)
-                pos = features.loc_to_tensor_pos(loc,board)
-                seki_by_loc2.append((loc,seki_flat2[pos]))
-
-        moves_and_probs = sorted(moves_and_probs0, key=lambda moveandprob: moveandprob[1], reverse=True)
-        # Generate a random number biased small and then find the appropriate move to make
-        # Interpolate from moving uniformly to choosing from the triangular distribution
-        alpha = 1
-        beta = 1 + math.sqrt(max(0,len(self.moves)-20))
-        r = np.random.beta(alpha,beta)
-        probsum = 0.0
-        i = 0
-        genmove_result = Board.PASS_LOC
-        while True:
-            (move,prob) = moves_and_probs[i]
-            probsum += prob
-            if i >= len(moves_and_probs)-1 or probsum > r:
-                genmove_result = move
-                break
-            i += 1
-
-        # Transpose attention so that both it and reverse attention are in n c (hw) format.
-        for name in list(extra_outputs.returned.keys()):
-            if name.endswith(".attention"):
-                extra_outputs.returned[name] = torch.transpose(extra_outputs.returned[name],1,2)
-
-        return {
-            "policy0": policy0,
-            "policy1": policy1,
-            "moves_and_probs0": moves_and_probs0,
-            "moves_and_probs1": moves_and_probs1,
-            "value": value,
-            "td_value": td_value,
-            "td_value2": td_value2,
-            "td_value3": td_value3,
-            "scoremean": scoremean,
-            "td_score": td_score,
-            "scorestdev": scorestdev,
-            "lead": lead,
-            "vtime": vtime,
-            "estv": estv,
-            "ests": ests,
-            "ownership": ownership,
-            "ownership_by_loc": ownership_by_loc,
-            "scoring": scoring,
-            "scoring_by_loc": scoring_by_loc,
-            "futurepos": futurepos,
-            "futurepos0_by_loc": futurepos0_by_loc,
-            "futurepos1_by_loc": futurepos1_by_loc,
-            "seki": seki,
-            "seki_by_loc": seki_by_loc,
-            "seki2": seki2,
-            "seki_by_loc2": seki_by_loc2,
-            "scorebelief": scorebelief,
-            "qwinloss": qwinloss,
-            "qscore": qscore,
-            "genmove_result": genmove_result,
-            **{ name:activation[0].cpu().numpy() for name, activation in extra_outputs.returned.items() },
-            "available_extra_outputs": available_extra_outputs,
-        }
+                    qwinloss = torch.zeros_like(policy_logits[0,:]).cpu().numpy()
+                    qscore = torch.zeros_like(policy_logits[0,:]).cpu().numpy()
+                row["qwinloss"] = qwinloss
+                row["qscore"] = qscore
+
+        if wanted("moves_and_probs0", "moves_and_probs1", "top_move0", "genmove_result"):
+            # Legal moves in tensor position order, then pass
+            locs, poss = features.loc_pos_map(board)
+            legal = board.legal_mask(board.pla, locs)
+            legal_locs = np.append(locs[legal], Board.PASS_LOC)
+            legal_poss = np.append(poss[legal], features.pass_pos)
+
+        if wanted("moves_and_probs0", "genmove_result"):
+            moves_and_probs0 = list(zip(legal_locs.tolist(), policy0[legal_poss]))
+            row["moves_and_probs0"] = moves_and_probs0
+
+        if wanted("moves_and_probs1"):
+            row["moves_and_probs1"] = list(zip(legal_locs.tolist(), policy1[legal_poss]))
+
+        if wanted("top_move0"):
+            # The first of the most likely moves in moves_and_probs0, without building it
+            legal_probs = policy0[legal_poss]
+            top = int(np.argmax(legal_probs))
+            row["top_move0"] = (int(legal_locs[top]), legal_probs[top])
+
+        def by_loc(flat, from_white_view=True):
+            values_by_loc = []
+            for y in range(board.y_size):
+                for x in range(board.x_size):
+                    loc = board.loc(x,y)
+                    pos = features.loc_to_tensor_pos(loc,board)
+                    if board.pla == Board.WHITE or not from_white_view:
+                        values_by_loc.append((loc,flat[pos]))
+                    else:
+                        values_by_loc.append((loc,-flat[pos]))
+            return values_by_loc
+
+        flat_len = features.pos_len * features.pos_len
+        if wanted("ownership_by_loc"):
+            row["ownership_by_loc"] = by_loc(row["ownership"].reshape([flat_len]))
+        if wanted("scoring_by_loc"):
+            row["scoring_by_loc"] = by_loc(row["scoring"].reshape([flat_len]))
+        if wanted("futurepos0_by_loc"):
+            row["futurepos0_by_loc"] = by_loc(row["futurepos"][0,:,:].reshape([flat_len]))
+        if wanted("futurepos1_by_loc"):
+            row["futurepos1_by_loc"] = by_loc(row["futurepos"][1,:,:].reshape([flat_len]))
+        if wanted("seki_by_loc"):
+            row["seki_by_loc"] = by_loc(row["seki"].reshape([flat_len]))
+        if wanted("seki_by_loc2"):
+            row["seki_by_loc2"] = by_loc(row["seki2"].reshape([flat_len]), from_white_view=False)
+
+        if wanted("genmove_result"):
+            moves_and_probs = sorted(moves_and_probs0, key=lambda moveandprob: moveandprob[1], reverse=True)
+            # Generate a random number biased small and then find the appropriate move to make
+            # Interpolate from moving uniformly to choosing from the triangular distribution
+            alpha = 1
+            beta = 1 + math.sqrt(max(0,move_idx-20))
+            r = np.random.beta(alpha,beta)
+            probsum = 0.0
+            i = 0
+            genmove_result = Board.PASS_LOC
+            while True:
+                (move,prob) = moves_and_probs[i]
+                probsum += prob
+                if i >= len(moves_and_probs)-1 or probsum > r:
+                    genmove_result = move
+                    break
+                i += 1
+            row["genmove_result"] = genmove_result
+
+        result = {name: row[name] for name in GameState.OUTPUT_NAMES if wanted(name)}
+        result.update({ name:activation[n].cpu().numpy() for name, activation in extra_outputs.returned.items() })
+        if wanted("available_extra_outputs"):
+            result["available_extra_outputs"] = available_extra_outputs
+        return result
 
@@ -0,0 +1,240 @@
+import os
+import sys
+import glob
+import time
+import random
+import string
+import argparse
+
+from gamestate import GameState
+from board import Board
+from sgfmill import sgf
+from dataclasses import dataclass
+from review import (
+    HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL, KATA_CACHE_PATH, KATA_MERGED_QUERY, KATA_PROFILE_PREFILTER, HSL_WIRE_FORMAT,
+    CardFinder, get_sgfmeta, get_rank_sweep_sgfmetas, get_difficulty_rank, load_sgf_game_state, is_player_move, loc_state_to_coord,
+    start_hsl_server, send_command, receive_response, start_kata_server,
+)
+from card_renderer import CardRenderer
+from reduced_precision import PRECISION_OPTIONS, get_precision_error
+from kata_cache import KataCache
+
+@dataclass
+class ReviewStats:
+    """How many positions each review stage let through and how long it took."""
+    moves: int = 0
+    candidates: int = 0
+    kata_queries: int = 0
+    profile_skipped: int = 0
+    cards: int = 0
+    hsl_seconds: float = 0.0
+    kata_seconds: float = 0.0
+    render_seconds: float = 0.0
+
+    def add(self, other):
+        self.moves += other.moves
+        self.candidates += other.candidates
+        self.kata_queries += other.kata_queries
+        self.profile_skipped += other.profile_skipped
+        self.cards += other.cards
+        self.hsl_seconds += other.hsl_seconds
+        self.kata_seconds += other.kata_seconds
+        self.render_seconds += other.render_seconds
+
+    def __str__(self):
+        return (f"HSL {self.moves} moves -> {self.candidates} candidates ({self.hsl_seconds:.2f}s), "
+                f"KataGo {self.kata_queries} queries, {self.profile_skipped} skipped by score loss -> {self.cards} cards ({self.kata_seconds:.2f}s), "
+                f"render ({self.render_seconds:.2f}s)")
+
+class BatchReviewer:
+    """Reviews SGF files without a GUI and writes every found card to the output directory."""
+
+    def __init__(self, hsl_server_process, kata_server, player, output_path, sgfmeta, card_format="png", kata_cache=None, merged_kata_query=KATA_MERGED_QUERY, profile_prefilter=KATA_PROFILE_PREFILTER):
+        self.hsl_server_process = hsl_server_process
+        self.card_finder = CardFinder(kata_server, kata_cache, merged_kata_query)
+        self.player = player
+        self.output_path = output_path
+        self.sgfmeta = sgfmeta
+        self.card_format = card_format
+        self.profile_prefilter = profile_prefilter
+
+    def send_command(self, command):
+        send_command(self.hsl_server_process, command)
+        response = receive_response(self.hsl_server_process)
+        if "outputs" not in response:
+            raise OSError(f"Unexpected response from server: {response}")
+        return response["outputs"]
+
+    def review(self, sgf_file):
+        """Reviews one game in three stages and returns its ReviewStats:
+        1. HSL on every move of the player, keeping the positions where it disagrees with the game move nearby
+        2. KataGo on all those positions at once, keeping the ones that pass the score thresholds.
+           With the profile prefilter, first drops the positions where the game move lost too few points
+        3. Labeling the cards with their difficulty and writing them
+        """
+        stats = ReviewStats()
+        game_state = load_sgf_game_state(sgf_file)
+        board_size = game_state.board.x_size
+
+        kata_queries = self.card_finder.kata_queries
+        profile = None
+        if self.profile_prefilter:
+            # KataGo works on the profile while HSL runs
+            profile = self.card_finder.submit_score_loss_profile(game_state.moves, game_state.board, self.player, self.get_move_indices(game_state))
+
+        start = time.perf_counter()
+        positions, candidates = self.get_candidates(game_state)
+        stats.moves = len(positions)
+        stats.candidates = len(candidates)
+        stats.hsl_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if profile is not None:
+            profiled_candidates = self.card_finder.filter_by_score_loss(candidates, profile.result())
+            stats.profile_skipped = len(candidates) - len(profiled_candidates)
+            candidates = profiled_candidates
+        candidates, cards = self.card_finder.score_candidates(candidates, self.player)
+        stats.kata_queries = self.card_finder.kata_queries - kata_queries
+        stats.cards = len(cards)
+        stats.kata_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.label_difficulty(candidates, cards)
+        stats.hsl_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if not os.path.exists(self.output_path):
+            os.makedirs(self.output_path)
+        card_renderer = CardRenderer(board_size)
+        for candidate, card in zip(candidates, cards):
+            rnd_filename = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+            if self.card_format == "png":
+                card_renderer.write_card(self.output_path, rnd_filename, candidate.board, self.player, card)
+            else:
+                self.write_sgf_card(rnd_filename, candidate.board, card)
+        stats.render_seconds = time.perf_counter() - start
+
+        return stats
+
+    def get_candidates(self, game_state):
+        """Runs HSL on every move of the player. Returns the positions as passed to CardFinder.find_cards, and the Candidates among them."""
+        board_size = game_state.board.x_size
+        self.send_command({"command": "set_position", "board_x_size": board_size, "board_y_size": board_size, "rules": GameState.RULES_JAPANESE, "moves": game_state.moves})
+
+        move_indices = self.get_move_indices(game_state)
+        # Only the top HSL move is needed, not the whole policy
+        outputs = self.send_command({"command": "get_model_outputs_batch", "sgfmeta": self.sgfmeta.to_dict(), "move_indices": move_indices, "output_names": ["top_move0"]})
+
+        positions = [(game_state.moves[:i], game_state.boards[i], output["top_move0"][0], game_state.moves[i][1]) for i, output in zip(move_indices, outputs)]
+        return positions, self.card_finder.get_candidates(positions)
+
+    def label_difficulty(self, candidates, cards):
+        """Sets the difficulty of each card, from the top HSL move of its position at every rank, evaluated in one sweep.
+        The server still has the game of get_candidates."""
+        if not cards:
+            return
+        sgfmetas = get_rank_sweep_sgfmetas(self.sgfmeta)
+        outputs = self.send_command({"command": "get_model_outputs_sweep", "sgfmetas": [sgfmeta.to_dict() for sgfmeta in sgfmetas], "move_indices": [len(candidate.moves) for candidate in candidates], "output_names": ["top_move0"]})
+
+        rank_idx = self.sgfmeta.inverseBRank if self.player == "B" else self.sgfmeta.inverseWRank
+        for candidate, card, outputs_by_rank in zip(candidates, cards, outputs):
+            top_moves_by_rank = [loc_state_to_coord(candidate.board, output["top_move0"][0]) for output in outputs_by_rank]
+            card.difficulty = get_difficulty_rank(top_moves_by_rank, card.hsl_move, rank_idx)
+
+    def get_move_indices(self, game_state):
+        # Like the GUI review, the first move is never turned into a card
+        return [i for i, (pla, loc) in enumerate(game_state.moves) if i > 0 and is_player_move(self.player, pla)]
+
+    def write_sgf_card(self, filename, board, card):
+        size = board.x_size
+
+        black = []
+        white = []
+        for y in range(board.y_size):
+            for x in range(board.x_size):
+                color = board.board[board.loc(x, y)]
+                if color == Board.BLACK:
+                    black.append((size - 1 - y, x))
+                elif color == Board.WHITE:
+                    white.append((size - 1 - y, x))
+
+        game = sgf.Sgf_game(size)
+        root = game.get_root()
+        root.set("KM", 6.5)
+        root.set_setup_stones(black, white)
+        root.set("PL", self.player.lower())
+
+        answer = game.extend_main_sequence()
+        answer.set("MA", {(size - 1 - card.actual_move.y, card.actual_move.x)})
+        answer.set("CR", {(size - 1 - card.hsl_move.y, card.hsl_move.x)})
+        comment = f"X = Game move ({card.actual_score:.1f})\nO = HSL move ({card.hsl_score:.1f})\nKataGo best in grid: {card.kata_score:.1f}"
+        if card.difficulty is not None:
+            comment += f"\nHSL plays O from: {card.difficulty}"
+        answer.set("C", comment)
+
+        with open(os.path.join(self.output_path, filename + ".sgf"), "wb") as f:
+            f.write(game.serialise())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='HSL checkpoint', required=True)
+    parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', required=True)
+    parser.add_argument('-max-batch-size', help='Max positions the HSL model evaluates at once', type=int, default=32, required=False)
+    parser.add_argument('-fuse', help='Fold the HSL normalization layers into the convolutions', action='store_true', required=False)
+    parser.add_argument('-compile', help='Run the HSL model as a traced graph, kept next to the checkpoint for later reviews', action='store_true', required=False)
+    parser.add_argument('-precision', help='Run the HSL model in bf16 autocast or with int8 linear layers (cpu only)', choices=PRECISION_OPTIONS, default="fp32", required=False)
+    parser.add_argument('-symmetries', help='Board symmetries the HSL model averages over, from 1 to 8', type=int, default=1, required=False)
+    parser.add_argument('-wire-format', help='How the HSL server sends model outputs', choices=["json", "binary"], default=HSL_WIRE_FORMAT, required=False)
+    parser.add_argument('-katago-path', help='KataGo executable', required=True)
+    parser.add_argument('-katago-config', help='KataGo analysis config', required=True)
+    parser.add_argument('-katago-model', help='KataGo model', required=True)
+    parser.add_argument('-sgf-dir', help='Directory with the SGF files to review', required=True)
+    parser.add_argument('-player', help='Color you played in the games', choices=["B", "W"], required=True)
+    parser.add_argument('-output-dir', help='Directory to write the cards to', default=os.getcwd() + "/output", required=False)
+    parser.add_argument('-kata-cache', help='File to keep KataGo results in between reviews, or "none"', default=KATA_CACHE_PATH, required=False)
+    parser.add_argument('-merged-kata-query', help='Score the HSL and actual moves from the grid query instead of queries of their own', action='store_true', default=KATA_MERGED_QUERY, required=False)
+    parser.add_argument('-score-loss-prefilter', help='Skip moves that lost too few points in a quick whole-game analysis', action='store_true', default=KATA_PROFILE_PREFILTER, required=False)
+    parser.add_argument('-card-format', help='Write cards as png images for the trainer or as sgf files', choices=["png", "sgf"], default="png", required=False)
+    args = parser.parse_args()
+
+    precision_error = get_precision_error(args.precision, args.device, args.compile)
+    if precision_error is not None:
+        print(f"Error: {precision_error}")
+        sys.exit(1)
+
+    sgf_files = sorted(glob.glob(os.path.join(args.sgf_dir, "*.sgf")))
+    if not sgf_files:
+        print(f"Error: No sgf files found in {args.sgf_dir}")
+        sys.exit(1)
+
+    hsl_args = ["-max-batch-size", str(args.max_batch_size), "-symmetries", str(args.symmetries), "-precision", args.precision]
+    if args.fuse:
+        hsl_args.append("-fuse")
+    if args.compile:
+        hsl_args.append("-compile")
+    hsl_server_process = start_hsl_server(args.checkpoint, args.device, hsl_args, args.wire_format)
+    kata_server = start_kata_server(args.katago_path, args.katago_config, args.katago_model)
+    sgfmeta = get_sgfmeta(HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL)
+
+    kata_cache = None
+    if args.kata_cache is not None and args.kata_cache.lower() != "none":
+        kata_cache = KataCache(args.kata_cache, args.katago_model, args.katago_config)
+
+    reviewer = BatchReviewer(hsl_server_process, kata_server, args.player, args.output_dir, sgfmeta, args.card_format, kata_cache, args.merged_kata_query, args.score_loss_prefilter)
+    total_stats = ReviewStats()
+    try:
+        for sgf_file in sgf_files:
+            stats = reviewer.review(sgf_file)
+            total_stats.add(stats)
+            print(f"{os.path.basename(sgf_file)}: {stats.cards} cards | {stats}")
+        print(f"Total: {total_stats.cards} cards | {total_stats}")
+        if kata_cache is not None:
+            print(f"KataGo cache: {kata_cache.hits} hits, {kata_cache.misses} misses")
+    finally:
+        hsl_server_process.terminate()
+        kata_server.close()
+
+    print("=== REVIEW DONE ===")
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,28 @@
 import wx
-import subprocess
-import json
 import sys
 import os
 from threading import Thread
-import atexit
-import datetime
 import time
-import math
 import random
 import string
 
 from gamestate import GameState
 from board import Board
 from sgfmetadata import SGFMetadata
-from query_analysis_engine_example import KataGo
-
-from sgfmill import sgf, sgf_moves
+from review import (
+    HSL_SOURCE, HSL_RANK, HSL_DATE, HSL_TIME_CONTROL, KATA_CACHE_PATH,
+    HSL_SOURCE_OPTIONS, HSL_RANK_OPTIONS, HSL_DATE_OPTIONS, HSL_TIME_CONTROL_OPTIONS,
+    CardFinder, get_sgfmeta, load_sgf_game_state, is_player_move,
+    loc_state_to_coord, loc_coord_to_state, loc_kata_to_coord,
+    start_hsl_server, send_command, receive_response, start_kata_server,
+)
+from card_renderer import BoardDrawing, CardRenderer
+from kata_cache import KataCache
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import numpy as np
 
-GRID_SIZE = 7
-GRID_RADIUS = math.floor(GRID_SIZE / 2)
-
-MIN_SCORE_DIFF_ACTUAL_HSL = 2
-MAX_SCORE_DIFF_ACTUAL_HSL = 10
-MAX_SCORE_DIFF_HSL_KATA = 1
-
-HSL_SOURCE = "OGS"
-HSL_RANK = "2d"
-HSL_DATE = 2022
-HSL_TIME_CONTROL = "Slow"
-
-HSL_ACTUAL_COMPARE_VISITS = 500
-KATA_BEST_VISITS = 2_500
-
 def interpolateColor(points,x):
     for i in range(len(points)):
         x1,c1 = points[i]
@@ -62,44 +48,54 @@ def policy_color(prob):
     r,g,b,a = interpolateColor(POLICY_COLORS,prob**0.25)
     return (round(r), round(g), round(b), round(a))
 
-def load_sgf_game_state(file_path):
-    with open(file_path, 'rb') as f:
-        game = sgf.Sgf_game.from_bytes(f.read())
+class WxPainter:
+    """Paints BoardDrawing's shapes with a wx.GraphicsContext."""
+
+    def __init__(self, gc, size):
+        self.gc = gc
+        self.size = size
 
-    size = game.get_size()
-    if size < 9 or size > 19:
-        raise ValueError("Board size must be between 9 and 19 inclusive.")
+    def pen(self, color, width):
+        return wx.TRANSPARENT_PEN if color is None else wx.Pen(wx.Colour(*color), width)
 
-    board, plays = sgf_moves.get_setup_and_moves(game)
+    def brush(self, color):
+        return wx.TRANSPARENT_BRUSH if color is None else wx.Brush(wx.Colour(*color))
 
-    moves = []
-    for x in range(size):
-        for y in range(size):
-            color = board.get(x, y)
-            if color is not None:
-                moves.append((y, 18 - x, (Board.BLACK if color == "b" else Board.WHITE)))
+    def clear(self, color):
+        self.gc.SetBrush(self.brush(color))
+        self.gc.SetPen(wx.TRANSPARENT_PEN)
+        self.gc.DrawRectangle(0, 0, self.size.Width, self.size.Height)
 
-    for color, move in plays:
-        if move is not None:
-            x, y = move
-            moves.append((y, 18 - x, (Board.BLACK if color == "b" else Board.WHITE)))
+    def line(self, x, y, x2, y2, color, width):
+        self.gc.SetPen(self.pen(color, width))
+        self.gc.StrokeLine(x, y, x2, y2)
 
-    game_state = GameState(size, GameState.RULES_JAPANESE)
-    for (x,y,color) in moves:
-        game_state.play(color, game_state.board.loc(x,y))
+    def circle(self, x, y, r, fill, outline, width):
+        self.gc.SetBrush(self.brush(fill))
+        self.gc.SetPen(self.pen(outline, width))
+        self.gc.DrawEllipse(x - r, y - r, 2 * r, 2 * r)
 
-    return game_state
+    def rectangle(self, x, y, x2, y2, outline, width):
+        self.gc.SetBrush(wx.TRANSPARENT_BRUSH)
+        self.gc.SetPen(self.pen(outline, width))
+        self.gc.DrawRectangle(x, y, x2 - x, y2 - y)
 
-class GoBoard(wx.Panel):
+    def text(self, x, y, text, color, points, centered):
+        self.gc.SetFont(wx.Font(points, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL), wx.Colour(*color))
+        if centered:
+            text_width, text_height = self.gc.GetTextExtent(text)
+            x -= text_width // 2
+            y -= text_height // 2
+        self.gc.DrawText(text, x, y)
+
+class GoBoard(wx.Panel, BoardDrawing):
     def __init__(self, parent, game_state, cell_size=30, margin=30):
         super().__init__(parent)
         self.game_state = game_state
         self.board_size = game_state.board.x_size
         self.cell_size = cell_size
         self.margin = margin
-
-        self.should_draw_review_grid = False
-        self.should_draw_review_moves = False
+        self.scale = 1
 
         self.sgfmeta = SGFMetadata()
         self.latest_model_response = None
@@ -108,120 +104,10 @@ class GoBoard(wx.Panel):
         self.Bind(wx.EVT_PAINT, self.on_paint)
         self.Bind(wx.EVT_LEFT_UP, self.on_click)
 
-    def get_desired_size(self):
-        board_width = self.board_size * self.cell_size + 2 * self.margin
-        board_height = self.board_size * self.cell_size + self.cell_size + 2 * self.margin
-        return board_width, board_height
-
-    def px_of_x(self, x):
-        return round(self.cell_size * x + self.margin + self.cell_size / 2)
-    def py_of_y(self, y):
-        return round(self.cell_size * y + self.margin + self.cell_size + self.cell_size / 2)
-
-    def x_of_px(self, px):
-        return round((px - self.margin - self.cell_size / 2) / self.cell_size)
-    def y_of_py(self, py):
-        return round((py - self.margin - self.cell_size - self.cell_size / 2) / self.cell_size)
-
-    def screenshot(self, filename):
-        output_path = os.getcwd() + "/output"
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        filename += ".png"
-        
-        size = self.GetSize()
-        bitmap = wx.Bitmap(size.width, size.height)
-        mem_dc = wx.MemoryDC()
-        mem_dc.SelectObject(bitmap)
-
-        dc = wx.ClientDC(self)
-        mem_dc.Blit(0, 0, size.width, size.height, dc, 0, 0)
-        bitmap.SaveFile(output_path + "/" + filename, wx.BITMAP_TYPE_PNG)
-        mem_dc.SelectObject(wx.NullBitmap)
-
     def on_paint(self, event):
         dc = wx.AutoBufferedPaintDC(self)
         gc = wx.GraphicsContext.Create(dc)
-
-        gc.SetBrush(wx.Brush(wx.Colour(200, 150, 100)))
-        gc.SetPen(wx.TRANSPARENT_PEN)
-        gc.DrawRectangle(0, 0, self.GetSize().Width, self.GetSize().Height)
-
-        gc.SetPen(wx.Pen(wx.BLACK, 1))
-
-        for i in range(self.board_size):
-            gc.StrokeLine(
-                self.px_of_x(0),
-                self.py_of_y(i),
-                self.px_of_x(self.board_size - 1),
-                self.py_of_y(i),
-            )
-            gc.StrokeLine(
-                self.px_of_x(i),
-                self.py_of_y(0),
-                self.px_of_x(i),
-                self.py_of_y(self.board_size - 1),
-            )
-
-        for x in range(self.board_size):
-            for y in range(self.board_size):
-                loc = self.game_state.board.loc(x, y)
-
-                if self.game_state.board.board[loc] == Board.BLACK:
-                    gc.SetBrush(wx.Brush(wx.BLACK))
-                    gc.DrawEllipse(self.px_of_x(x) - (self.cell_size // 2 - 2), self.py_of_y(y) - (self.cell_size // 2 - 2), self.cell_size - 4, self.cell_size - 4)
-                elif self.game_state.board.board[loc] == Board.WHITE:
-                    gc.SetBrush(wx.Brush(wx.WHITE))
-                    gc.DrawEllipse(self.px_of_x(x) - (self.cell_size // 2 - 2), self.py_of_y(y) - (self.cell_size // 2 - 2), self.cell_size - 4, self.cell_size - 4)
-
-        gc.SetBrush(wx.Brush(wx.BLACK, wx.TRANSPARENT))
-        
-        if self.should_draw_review_grid:
-            parent = self.GetParent().GetParent()
-
-            gc.SetPen(wx.Pen(wx.BLUE, 4))
-            x = self.px_of_x(max(parent.actual_move.x - GRID_RADIUS, 0)) - self.cell_size / 2
-            y = self.py_of_y(max(parent.actual_move.y - GRID_RADIUS, 0)) - self.cell_size / 2
-            w = self.px_of_x(min(parent.actual_move.x + GRID_RADIUS, 18)) - x + self.cell_size / 2
-            h = self.py_of_y(min(parent.actual_move.y + GRID_RADIUS, 18)) - y + self.cell_size / 2
-            gc.DrawRectangle(x, y, w, h)
-
-            if self.should_draw_review_moves:
-                gc.SetPen(wx.Pen(wx.BLACK, 4))
-                gc.DrawEllipse(self.px_of_x(parent.hsl_move.x) - (self.cell_size // 2 - 6), self.py_of_y(parent.hsl_move.y) - (self.cell_size // 2 - 6), self.cell_size - 12, self.cell_size - 12)
-
-                gc.SetFont(wx.Font(26, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL), wx.Colour(0, 0, 0, 100))
-                gc.DrawText("x", self.px_of_x(parent.actual_move.x) - (self.cell_size // 2 - 6), self.py_of_y(parent.actual_move.y) - (self.cell_size // 2 + 13))
-
-                # if (parent.kata_move != parent.hsl_move):
-                #     gc.DrawRectangle(self.px_of_x(parent.kata_move.x) - (self.cell_size // 2 - 6), self.py_of_y(parent.kata_move.y) - (self.cell_size // 2 - 6), self.cell_size - 12, self.cell_size - 12)
-
-        gc.SetFont(wx.Font(16, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL), wx.Colour(0, 150, 0))
-        label = " to play"
-        if (self.GetParent().GetParent().player == "B"):
-            label = "Black" + label
-        else:
-            label = "White" + label
-        gc.DrawText(label, 255, 15)
-
-        # Draw column labels
-        gc.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL), wx.BLACK)
-        for x in range(self.board_size):
-            col_label = "ABCDEFGHJKLMNOPQRSTUVWXYZ"[x]
-            text_width, text_height = gc.GetTextExtent(col_label)
-            text_x = self.px_of_x(x) - text_width // 2
-            gc.DrawText(col_label, text_x, self.py_of_y(-0.8)-text_height//2)
-            gc.DrawText(col_label, text_x, self.py_of_y(self.board_size-0.2)-text_height//2)
-
-        # Draw row labels
-        for y in range(self.board_size):
-            row_label = str(self.board_size - y)
-            text_width, text_height = gc.GetTextExtent(row_label)
-            text_y = self.py_of_y(y) - text_height // 2
-            gc.DrawText(row_label, self.px_of_x(-0.8)-text_width//2, text_y)
-            gc.DrawText(row_label, self.px_of_x(self.board_size-0.2)-text_width//2, text_y)
-
+        self.draw_board(WxPainter(gc, self.GetSize()), self.game_state.board, self.GetParent().GetParent().player)
 
     def on_click(self, event):
         x = self.x_of_px(event.GetX())
@@ -234,13 +120,6 @@ class GoBoard(wx.Panel):
             if self.game_state.board.would_be_legal(pla,loc):
                 self.game_state.play(pla, loc)
 
-                command = {"command": "play", "pla": pla, "loc": loc}
-                parent = self.GetParent().GetParent()
-                parent.send_command(parent.hsl_server_process, command)
-                response = parent.receive_response(parent.hsl_server_process)
-                if response != {"outputs": ""}:
-                    parent.handle_error(f"Unexpected response from server: {response}")
-
                 self.Refresh()
                 self.refresh_model()
 
@@ -248,8 +127,9 @@ class GoBoard(wx.Panel):
         self.sgfmeta = sgfmeta
 
     def refresh_model(self):
+        # The server catches up with the moves played or undone since the last refresh by itself
         sgfmeta = self.sgfmeta
-        command = {"command": "get_model_outputs", "sgfmeta": sgfmeta.to_dict()}
+        command = {"command": "set_position", "moves": self.game_state.moves, "sgfmeta": sgfmeta.to_dict()}
         parent = self.GetParent().GetParent()
         parent.send_command(parent.hsl_server_process, command)
         response = parent.receive_response(parent.hsl_server_process)
@@ -324,28 +204,25 @@ class SliderWindow(wx.Frame):
         panel_sizer = wx.BoxSizer(wx.VERTICAL)
         panel_sizer.Add(400,0,0)
 
-        self.source_slider = LabeledSlider(panel, title="Source", options=["KG","OGS","KGS","Fox","Tygem(Unused)","GoGoD","Go4Go"],
+        self.source_slider = LabeledSlider(panel, title="Source", options=HSL_SOURCE_OPTIONS,
             on_scroll_callback = (lambda idx, option: self.update_metadata()),
             start_option=HSL_SOURCE,
         )
         panel_sizer.Add(self.source_slider, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
 
-        self.rank_slider = LabeledSlider(panel, title="Rank", options=[
-            "KG","9d","8d","7d","6d","5d","4d","3d","2d","1d","1k","2k","3k","4k","5k","6k","7k","8k","9k","10k","11k","12k","13k","14k","15k","16k","17k","18k","19k","20k"
-            ],
+        self.rank_slider = LabeledSlider(panel, title="Rank", options=HSL_RANK_OPTIONS,
             on_scroll_callback = (lambda idx, option: self.update_metadata()),
             start_option=HSL_RANK,
         )
         panel_sizer.Add(self.rank_slider, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
 
-        self.date_slider = LabeledSlider(panel, title="Date", options=[
-            1800,1825,1850,1875,1900,1915,1930,1940,1950,1960,1970,1980,1985,1990,1995,2000,2005,2008,2010,2012,2013,2014,2015,2016,2017,2018,2019,2020,2021,2022,2023],
+        self.date_slider = LabeledSlider(panel, title="Date", options=HSL_DATE_OPTIONS,
             on_scroll_callback = (lambda idx, option: self.update_metadata()),
             start_option=HSL_DATE,
         )
         panel_sizer.Add(self.date_slider, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
 
-        self.tc_slider = LabeledSlider(panel, title="TimeControl", options=["Blitz","Fast","Slow","Unknown"],
+        self.tc_slider = LabeledSlider(panel, title="TimeControl", options=HSL_TIME_CONTROL_OPTIONS,
             on_scroll_callback = (lambda idx, option: self.update_metadata()),
             start_option=HSL_TIME_CONTROL,
         )
@@ -365,20 +242,11 @@ class SliderWindow(wx.Frame):
         self.GetParent().Close()
 
     def update_metadata(self):
-        sgfmeta = SGFMetadata(
-            inverseBRank = self.rank_slider.get_selected_index(),
-            inverseWRank = self.rank_slider.get_selected_index(),
-            bIsHuman = self.rank_slider.get_selected_index() != 0,
-            wIsHuman = self.rank_slider.get_selected_index() != 0,
-            gameIsUnrated = False,
-            gameRatednessIsUnknown = self.source_slider.get_selected_option() == "KGS",
-            tcIsUnknown = self.tc_slider.get_selected_option() == "Unknown",
-            tcIsByoYomi = self.tc_slider.get_selected_option() != "Unknown",
-            mainTimeSeconds = [300,900,1800,0][self.tc_slider.get_selected_index()],
-            periodTimeSeconds = [10,15,30,0][self.tc_slider.get_selected_index()],
-            byoYomiPeriods = [5,5,5,0][self.tc_slider.get_selected_index()],
-            gameDate = datetime.date(self.date_slider.get_selected_option(),6,1),
-            source = self.source_slider.get_selected_index(),
+        sgfmeta = get_sgfmeta(
+            self.source_slider.get_selected_option(),
+            self.rank_slider.get_selected_option(),
+            self.date_slider.get_selected_option(),
+            self.tc_slider.get_selected_option(),
         )
 
         source = self.source_slider.get_selected_option()
@@ -414,19 +282,6 @@ class SliderWindow(wx.Frame):
         self.GetParent().board.set_sgfmeta(sgfmeta)
         self.GetParent().board.refresh_model()
 
-class Coord():
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-    
-    def __eq__(self, other):
-        if isinstance(other, Coord):
-            return self.x == other.x and self.y == other.y
-        return False
-    
-    def __str__(self):
-        return f"({self.x}, {self.y})"
-
 class ColorButtons(wx.Panel):
     def __init__(self, parent, player):
         super().__init__(parent)
@@ -467,31 +322,13 @@ class FileDropTarget(wx.FileDropTarget):
 
 class GoClient(wx.Frame):
     def loc_state_to_coord(self, state):
-        return Coord(self.game_state.board.loc_x(state), self.game_state.board.loc_y(state))
+        return loc_state_to_coord(self.game_state.board, state)
 
     def loc_coord_to_state(self, coord):
-        return self.game_state.board.loc(coord.x, coord.y)
+        return loc_coord_to_state(self.game_state.board, coord)
 
-    def loc_kata_to_coord(self, kata):
-        chars = [char for char in kata]
-
-        x = ord(chars[0])
-        # 'I' is skipped
-        if x <= 72:
-            x -= 65
-        else:
-            x -= 66
-            
-        return Coord(x, 19 - int(''.join(chars[1:])))
-
-    def loc_coord_to_kata(self, coord):
-        return "ABCDEFGHJKLMNOPQRSTUVWXYZ"[coord.x] + str(19 - coord.y)
-    
-    def loc_state_to_kata(self, state):
-        return self.loc_coord_to_kata(self.loc_state_to_coord(state))
-    
     def loc_kata_to_state(self, kata):
-        return self.loc_coord_to_state(self.loc_kata_to_coord(kata))
+        return self.loc_coord_to_state(loc_kata_to_coord(kata))
 
     def __init__(self, hsl_model_path, hsl_device, katago_exe_path, katago_analysis_cfg_path, katago_model_path, game_state, player):
         super().__init__(parent=None, title="HumanSLNetViz")
@@ -524,68 +361,24 @@ class GoClient(wx.Frame):
     
     def review(self):
         time.sleep(2)
+        card_renderer = CardRenderer(self.board_size)
 
         while len(self.game_state.redo_stack) > 1:
             self.redo()
 
-            move_state_player = self.game_state.redo_stack[-1][0][0]
-            if self.player == "B" and move_state_player == 2 or self.player == "W" and move_state_player == 1:
+            move_state_player = self.game_state.redo_stack[-1][0]
+            if not is_player_move(self.player, move_state_player):
                 continue
 
             moves_and_probs0 = self.board.latest_model_response["moves_and_probs0"]
+            actual_loc = self.game_state.redo_stack[-1][1]
 
-            highest_hsl_val = 0
-            highest_hsl_loc = 0
-            for prob in moves_and_probs0:
-                if prob[1] > highest_hsl_val:
-                    highest_hsl_val = prob[1]
-                    highest_hsl_loc = prob[0]
-            
-            self.hsl_move = self.loc_state_to_coord(highest_hsl_loc)
-            self.actual_move = self.loc_state_to_coord(self.game_state.redo_stack[-1][0][1])
-
-            if self.hsl_move == self.actual_move:
-                continue
-
-            if abs(self.hsl_move.x - self.actual_move.x) > GRID_RADIUS or abs(self.hsl_move.y - self.actual_move.y) > GRID_RADIUS:
-                continue
-
-            hsl_score = self.get_kata_score_lead(HSL_ACTUAL_COMPARE_VISITS, [self.hsl_move])[0][1]
-            actual_score = self.get_kata_score_lead(HSL_ACTUAL_COMPARE_VISITS, [self.actual_move])[0][1]
-
-            # print(f"HSL= {str(self.hsl_move)}: {hsl_score:.2f} | Actual= {str(self.actual_move)}: {actual_score:.2f}")
-            
-            if self.player == "B":
-                if (hsl_score - MIN_SCORE_DIFF_ACTUAL_HSL) < actual_score or (hsl_score - MAX_SCORE_DIFF_ACTUAL_HSL) > actual_score:
-                    continue
-            else:
-                if (hsl_score + MIN_SCORE_DIFF_ACTUAL_HSL) > actual_score or (hsl_score + MAX_SCORE_DIFF_ACTUAL_HSL) < actual_score:
-                    continue
-
-            allow_moves = []
-            for x in range(max(self.actual_move.x - GRID_RADIUS, 0), min(self.actual_move.x + GRID_RADIUS, 18) + 1):
-                for y in range(max(self.actual_move.y - GRID_RADIUS, 0), min(self.actual_move.y + GRID_RADIUS, 18) + 1):
-                    allow_moves.append(Coord(x, y))
-            
-            kata_score = self.get_kata_score_lead(KATA_BEST_VISITS, allow_moves)[0][1]
-
-            if abs(kata_score - hsl_score) > MAX_SCORE_DIFF_HSL_KATA:
+            card = self.card_finder.find_card(self.game_state, self.player, moves_and_probs0, actual_loc)
+            if card is None:
                 continue
 
             rnd_filename = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
-
-            self.board.should_draw_review_grid = True
-            self.board.Refresh()
-            time.sleep(0.25)
-            self.board.screenshot(rnd_filename + "_1")
-
-            self.board.should_draw_review_moves = True
-            self.board.Refresh()
-            time.sleep(0.25)
-            self.board.screenshot(rnd_filename + "_2")
-            
-            self.board.should_draw_review_grid = False
-            self.board.should_draw_review_moves = False
+            card_renderer.write_card(os.getcwd() + "/output", rnd_filename, self.game_state.board, self.player, card)
         
         print("=== REVIEW DONE ===")
 
@@ -626,121 +419,29 @@ class GoClient(wx.Frame):
 
 
     def start_server(self):
-        # print(f"Starting hsl server with command: {server_command}")
-        server_process = subprocess.Popen(
-            [sys.executable, f"scripts{os.sep}humanslnet_server.py", "-checkpoint", self.hsl_model_path, "-device", self.hsl_device],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-        atexit.register(server_process.terminate)
-
-        def print_stderr():
-            while True:
-                line = server_process.stderr.readline()
-                if not line:
-                    returncode = server_process.poll()
-                    if returncode is not None:
-                        return
-                print(line,end="")
-
-        t = Thread(target=print_stderr)
-        t.daemon = True
-        t.start()
-
-        return server_process
+        return start_hsl_server(self.hsl_model_path, self.hsl_device)
 
     def init_server(self, server_process):
-        command = {"command": "start", "board_x_size": self.board_size, "board_y_size": self.board_size, "rules": GameState.RULES_JAPANESE}
+        command = {"command": "set_position", "board_x_size": self.board_size, "board_y_size": self.board_size, "rules": GameState.RULES_JAPANESE, "moves": self.game_state.moves}
         self.send_command(server_process, command)
         response = self.receive_response(server_process)
         if response != {"outputs": ""}:
             self.handle_error(f"Unexpected response from server: {response}")
 
-        for (pla,loc) in self.game_state.moves:
-            command = {"command": "play", "pla": pla, "loc": loc}
-            self.send_command(server_process, command)
-            response = self.receive_response(server_process)
-            if response != {"outputs": ""}:
-                self.handle_error(f"Unexpected response from server: {response}")
-
     def start_kata_server(self):
-        self.kata_server = KataGo(self.katago_exe_path,
-                                  self.katago_analysis_cfg_path,
-                                  self.katago_model_path)
-        
-        atexit.register(self.kata_server.close)
-    
-    def get_kata_score_lead(self, max_visits, allow_moves = [], avoid_moves = []):
-        moves = []
-        for pla, loc in self.game_state.moves:
-            color = "b"
-            if (pla == 2):
-                color = "w"
-            
-            move = self.loc_state_to_kata(loc)
-            moves.append((color, move))
-
-        query = {
-            "id": str(self.kata_server.query_counter),
-            "moves": moves,
-            "rules": "Japanese",
-            "komi": 6.5,
-            "boardXSize": 19,
-            "boardYSize": 19,
-            "maxVisits": max_visits
-        }
-        self.kata_server.query_counter += 1
-
-        if allow_moves:
-            query["allowMoves"] = [{
-                "player": self.player,
-                "moves": [self.loc_coord_to_kata(coord) for coord in allow_moves],
-                "untilDepth": 1
-            }]
-        
-        if avoid_moves:
-            query["avoidMoves"] = [{
-                "player": self.player,
-                "moves": [self.loc_coord_to_kata(coord) for coord in avoid_moves],
-                "untilDepth": 1
-            }]
-
-        result = self.kata_server.query_raw(query)["moveInfos"]
-
-        result_by_score = None
-        if self.player == "B":
-            result_by_score = sorted(result, key=lambda x: x["scoreLead"], reverse=True)
-        else:
-            result_by_score = sorted(result, key=lambda x: x["scoreLead"])
-
-        output = []
-        best_score = result_by_score[0]["scoreLead"]
-        for move in result_by_score:
-            if abs(move["scoreLead"] - best_score) > 1:
-                break
-
-            output.append((self.loc_kata_to_coord(move["move"]), move["scoreLead"]))
-
-        return output
+        self.kata_server = start_kata_server(self.katago_exe_path,
+                                             self.katago_analysis_cfg_path,
+                                             self.katago_model_path)
+        kata_cache = None
+        if KATA_CACHE_PATH is not None:
+            kata_cache = KataCache(KATA_CACHE_PATH, self.katago_model_path, self.katago_analysis_cfg_path)
+        self.card_finder = CardFinder(self.kata_server, kata_cache)
 
     def send_command(self, server_process, command):
-        # print(f"Sending: {json.dumps(command)}")
-        server_process.stdin.write(json.dumps(command) + "\n")
-        server_process.stdin.flush()
+        send_command(server_process, command)
 
     def receive_response(self, server_process):
-        # print(f"Waiting for response")
-        while True:
-            returncode = server_process.poll()
-            if returncode is not None:
-                raise OSError(f"Server terminated unexpectedly with {returncode=}")
-            response = server_process.stdout.readline().strip()
-            if response != "":
-                break
-        # print(f"Got response (first 100 chars): {str(response[:100])}")
-        return json.loads(response)
+        return receive_response(server_process)
 
     def handle_error(self, error_message):
         print(f"Error: {error_message}")
@@ -775,12 +476,6 @@ class GoClient(wx.Frame):
 
             self.game_state.undo()
 
-            command = {"command": "undo"}
-            self.send_command(self.hsl_server_process, command)
-            response = self.receive_response(self.hsl_server_process)
-            if response != {"outputs": ""}:
-                self.handle_error(f"Unexpected response from server: {response}")
-
         if is_refresh_needed:
             self.board.Refresh()
             self.board.refresh_model()
@@ -795,12 +490,6 @@ class GoClient(wx.Frame):
 
             self.game_state.redo()
 
-            command = {"command": "redo"}
-            self.send_command(self.hsl_server_process, command)
-            response = self.receive_response(self.hsl_server_process)
-            if response != {"outputs": ""}:
-                self.handle_error(f"Unexpected response from server: {response}")
-
         if is_refresh_needed:
             self.board.Refresh()
             self.board.refresh_model()
@@ -1,10 +1,16 @@
 import sys
 import json
 import numpy as np
+from collections import OrderedDict
 from load_model import load_model
-from gamestate import GameState
+from compiled_model import compile_model
+from fuse_model import fuse_for_inference
+from reduced_precision import PRECISION_OPTIONS, get_precision_error, apply_precision
+from board import Board
+from gamestate import GameState, NUM_SYMMETRIES
 from features import Features
 from sgfmetadata import SGFMetadata
+from wire_format import encode_binary
 import argparse
 
 def numpy_array_encoder(obj):
@@ -14,21 +20,194 @@ def numpy_array_encoder(obj):
         return float(obj)
     raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
 
+# What the reviewers use, sent unless a command asks for other output_names
+REVIEW_OUTPUT_NAMES = ["moves_and_probs0", "value", "lead", "scorestdev"]
+
+def filter_outputs(outputs, output_names=REVIEW_OUTPUT_NAMES):
+    filtered_outputs = {}
+    for key in outputs:
+        if key in output_names:
+            filtered_outputs[key] = outputs[key]
+    return filtered_outputs
+
+class ResponseCache:
+    """Remembers the filtered outputs of recently evaluated positions, so revisiting a position with the same
+    metadata (scrubbing through a game, moving a slider back) needs no features or network.
+
+    The features depend on the board, including its player to move, ko point and non-pass moves made by each
+    color (territory scoring's komi), the two boards before it, the last five moves, the rules (encore phase
+    included) and, with a button, whether there was a pass before it, so positions are keyed by those, the sgfmeta
+    and the requested output names.
+    Least recently used entries are dropped when the estimated size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.outputs_of_key = OrderedDict()
+        self.bytes_of_key = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, game_state, move_idx, sgfmeta_dict, output_names):
+        boards = game_state.boards
+        board = boards[move_idx]
+        previous_zobrists = tuple(boards[i].zobrist for i in range(max(0, move_idx - 2), move_idx))
+        return (
+            board.x_size, board.y_size, board.zobrist, board.pla, board.simple_ko_point,
+            (board.num_non_pass_moves_made[Board.BLACK], board.num_non_pass_moves_made[Board.WHITE]),
+            previous_zobrists,
+            tuple(game_state.moves[max(0, move_idx - 5):move_idx]),
+            json.dumps(game_state.rules, sort_keys=True),
+            bool(game_state.rules.get("hasButton")) and Board.PASS_LOC in [loc for pla, loc in game_state.moves[:move_idx]],
+            json.dumps(sgfmeta_dict, sort_keys=True),
+            tuple(output_names),
+        )
+
+    def get(self, key):
+        outputs = self.outputs_of_key.get(key)
+        if outputs is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.outputs_of_key.move_to_end(key)
+        return outputs
+
+    def put(self, key, outputs):
+        if key in self.outputs_of_key:
+            return
+        size = estimate_bytes(outputs)
+        if size > self.max_bytes:
+            return
+        self.outputs_of_key[key] = outputs
+        self.bytes_of_key[key] = size
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            old_key, _ = self.outputs_of_key.popitem(last=False)
+            self.total_bytes -= self.bytes_of_key.pop(old_key)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, entries=len(self.outputs_of_key), bytes=self.total_bytes)
+
+def estimate_bytes(obj):
+    # Roughly what the object takes in memory, enough to keep the cache near its budget
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + 112
+    if isinstance(obj, dict):
+        return 64 + sum(estimate_bytes(key) + estimate_bytes(value) + 16 for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return 56 + sum(estimate_bytes(value) + 8 for value in obj)
+    if isinstance(obj, str):
+        return 49 + len(obj)
+    return 32
+
+DEFAULT_SESSION = "default"
+WIRE_FORMATS = ["json", "binary"]
+
+def set_position(sessions, data):
+    """Handles set_position and returns the session's GameState, now at the requested position.
+
+    The position is data["moves"] from the empty board, or with data["base_session"], the moves of that session
+    without its last data["undo"] moves, followed by data["moves"]. Board size and rules are needed for a new session.
+    """
+    moves = [tuple(move) for move in data["moves"]]
+    base_state = None
+    if "base_session" in data:
+        if data["base_session"] not in sessions:
+            raise ValueError(f"Unknown session: {data['base_session']}")
+        base_state = sessions[data["base_session"]]
+        moves = base_state.moves[:len(base_state.moves) - data.get("undo", 0)] + moves
+
+    name = data.get("session", DEFAULT_SESSION)
+    game_state = sessions.get(name)
+    template = game_state if game_state is not None else base_state
+    if template is not None:
+        board_x_size = data.get("board_x_size", template.board.x_size)
+        board_y_size = data.get("board_y_size", template.board.y_size)
+        rules = data.get("rules", template.rules)
+    else:
+        board_x_size = data["board_x_size"]
+        board_y_size = data["board_y_size"]
+        rules = data["rules"]
+
+    if game_state is None or (game_state.board.x_size, game_state.board.y_size) != (board_x_size, board_y_size) or game_state.rules != rules:
+        game_state = GameState((board_x_size,board_y_size), rules)
+        sessions[name] = game_state
+
+    game_state.set_moves(moves)
+    return game_state
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-checkpoint', help='Checkpoint to test', required=True)
     parser.add_argument('-use-swa', help='Use SWA model', action="store_true", required=False)
     parser.add_argument('-device', help='Device to use, such as cpu or cuda:0', required=True)
+    parser.add_argument('-max-batch-size', help='Max positions per forward pass for get_model_outputs_batch, each taking one row per symmetry', type=int, default=32, required=False)
+    parser.add_argument('-fuse', help='Fold the normalization layers into the convolutions and use channels-last memory format', action='store_true', required=False)
+    parser.add_argument('-compile', help='Run the model as a traced graph, kept next to the checkpoint for later starts', action='store_true', required=False)
+    parser.add_argument('-precision', help='Run the model in bf16 autocast or with int8 linear layers (cpu only), see evaluate_precision.py', choices=PRECISION_OPTIONS, default="fp32", required=False)
+    parser.add_argument('-symmetries', help='Average the outputs of this many board symmetries, more is steadier but slower', type=int, choices=range(1, NUM_SYMMETRIES+1), default=1, required=False)
+    parser.add_argument('-cache-mb', help='Memory for remembering outputs of evaluated positions, 0 to disable', type=float, default=64, required=False)
     args = parser.parse_args()
 
+    # stdout is the pipe responses go to
+    precision_error = get_precision_error(args.precision, args.device, args.compile)
+    if precision_error is not None:
+        print(f"Error: {precision_error}", file=sys.stderr)
+        sys.exit(1)
+
     model, swa_model, _ = load_model(args.checkpoint, use_swa=args.use_swa, device=args.device, pos_len=19, verbose=False)
     if swa_model is not None:
         model = swa_model
+    if args.fuse:
+        model = fuse_for_inference(model)
+    model = apply_precision(model, args.precision)
+    if args.compile:
+        # Every option that changes the weights the graph is traced from
+        variant = ",".join(name for name, used in [("swa", args.use_swa), ("fused", args.fuse)] if used)
+        model = compile_model(model, args.checkpoint, args.device, variant=variant)
     game_state = None
+    response_cache = ResponseCache(int(args.cache_mb * 1024 * 1024)) if args.cache_mb > 0 else None
+    # Positions by name, for set_position. The other commands work on the last started or set one
+    sessions = {}
+
+    wire_format = "json"
+    symmetries = list(range(args.symmetries))
+
+    def get_outputs(move_indices, sgfmeta_dicts, output_names):
+        """Filtered outputs of the positions before each of move_indices, each under its sgfmeta_dicts entry, from the cache where possible."""
+        # genmove_result is sampled, so it must not be repeated
+        use_cache = response_cache is not None and "genmove_result" not in output_names
+        outputs = [None] * len(move_indices)
+        keys = []
+        if use_cache:
+            keys = [response_cache.key(game_state, move_idx, sgfmeta_dict, output_names) for move_idx, sgfmeta_dict in zip(move_indices, sgfmeta_dicts)]
+            outputs = [response_cache.get(key) for key in keys]
+
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            # One SGFMetadata per distinct dict, so the model encodes each setting once
+            sgfmeta_of_json = {}
+            sgfmetas = []
+            for i in missing:
+                sgfmeta_json = json.dumps(sgfmeta_dicts[i], sort_keys=True)
+                if sgfmeta_json not in sgfmeta_of_json:
+                    sgfmeta_of_json[sgfmeta_json] = SGFMetadata.of_dict(sgfmeta_dicts[i])
+                sgfmetas.append(sgfmeta_of_json[sgfmeta_json])
+            computed = game_state.get_model_outputs_batch(model, [move_indices[i] for i in missing], sgfmeta=sgfmetas, max_batch_size=args.max_batch_size, output_names=output_names, symmetries=symmetries)
+            for i, output in zip(missing, computed):
+                outputs[i] = filter_outputs(output, output_names)
+                if use_cache:
+                    response_cache.put(keys[i], outputs[i])
+        return outputs
 
     def write(output):
-        sys.stdout.write(json.dumps(output,default=numpy_array_encoder) + "\n")
-        sys.stdout.flush()
+        if wire_format == "binary":
+            sys.stdout.buffer.write(encode_binary(output))
+            sys.stdout.buffer.flush()
+        else:
+            sys.stdout.write(json.dumps(output,default=numpy_array_encoder) + "\n")
+            sys.stdout.flush()
 
     # DEBUGGING
     # game_state = GameState(board_size=19, rules=GameState.RULES_JAPANESE)
@@ -48,8 +227,25 @@ def main():
             board_y_size = data["board_y_size"]
             rules = data["rules"]
             game_state = GameState((board_x_size,board_y_size), rules)
+            sessions[DEFAULT_SESSION] = game_state
             write(dict(outputs=""))
 
+        elif data["command"] == "set_wire_format":
+            # Answered in the current format, so clients that only know JSON can read the answer
+            requested_format = data["format"]
+            agreed_format = requested_format if requested_format in WIRE_FORMATS else "json"
+            write(dict(outputs="", format=agreed_format))
+            wire_format = agreed_format
+
+        elif data["command"] == "set_position":
+            # Replaces a start and a play per move. With sgfmeta, also answers like get_model_outputs
+            game_state = set_position(sessions, data)
+            if "sgfmeta" in data:
+                output_names = data.get("output_names", REVIEW_OUTPUT_NAMES)
+                write(dict(outputs=get_outputs([len(game_state.moves)], [data["sgfmeta"]], output_names)[0]))
+            else:
+                write(dict(outputs=""))
+
         elif data["command"] == "play":
             pla = data["pla"]
             loc = data["loc"]
@@ -65,15 +261,30 @@ def main():
             write(dict(outputs=""))
 
         elif data["command"] == "get_model_outputs":
-            sgfmeta = SGFMetadata.of_dict(data["sgfmeta"])
             # features = Features(model.config, model.pos_len)
             # foo = game_state.get_input_features(features)
-            outputs = game_state.get_model_outputs(model, sgfmeta=sgfmeta)
-            filtered_outputs = {}
-            for key in outputs:
-                if key in ["moves_and_probs0", "value", "lead", "scorestdev"]:
-                    filtered_outputs[key] = outputs[key]
-            write(dict(outputs=filtered_outputs))
+            output_names = data.get("output_names", REVIEW_OUTPUT_NAMES)
+            write(dict(outputs=get_outputs([len(game_state.moves)], [data["sgfmeta"]], output_names)[0]))
+
+        elif data["command"] == "get_model_outputs_batch":
+            # Positions before each of move_indices in the game so far, or all positions if not given
+            move_indices = data.get("move_indices")
+            if move_indices is None:
+                move_indices = list(range(len(game_state.moves)+1))
+            output_names = data.get("output_names", REVIEW_OUTPUT_NAMES)
+            write(dict(outputs=get_outputs(move_indices, [data["sgfmeta"]] * len(move_indices), output_names)))
+
+        elif data["command"] == "get_model_outputs_sweep":
+            # Positions before each of move_indices, or the current one, under every sgfmeta in sgfmetas (for example
+            # every rank) in one batch. outputs[i][j] is for move_indices[i] under sgfmetas[j]
+            move_indices = data.get("move_indices", [len(game_state.moves)])
+            sgfmeta_dicts = data["sgfmetas"]
+            output_names = data.get("output_names", REVIEW_OUTPUT_NAMES)
+            outputs = get_outputs([move_idx for move_idx in move_indices for _ in sgfmeta_dicts], sgfmeta_dicts * len(move_indices), output_names)
+            write(dict(outputs=[outputs[i*len(sgfmeta_dicts):(i+1)*len(sgfmeta_dicts)] for i in range(len(move_indices))]))
+
+        elif data["command"] == "get_cache_stats":
+            write(dict(outputs=response_cache.stats() if response_cache is not None else {}))
 
         else:
             raise ValueError(f"Unknown command: {data['command']}")
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+import sqlite3
+from threading import Lock
+
+def get_model_id(model_path):
+    if not os.path.isfile(model_path):
+        return os.path.basename(model_path)
+    stat = os.stat(model_path)
+    return [os.path.basename(model_path), stat.st_size, stat.st_mtime_ns]
+
+def get_config_hash(config_path):
+    if not os.path.isfile(config_path):
+        return ""
+    with open(config_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class KataCache:
+    """Stores the moveInfos of KataGo queries on disk, so positions seen in earlier reviews cost no KataGo time.
+
+    Queries are keyed by a hash of everything in them that affects the result (moves, rules, komi, maxVisits,
+    allowMoves, avoidMoves, ...) plus the KataGo model and analysis config, but not the query id. The model is
+    identified by its file name, size and modification time and the config by a hash of its contents, so replacing
+    either file with different contents under the same name doesn't return results of the old one.
+    """
+
+    def __init__(self, path, model_path="", config_path=""):
+        self.path = path
+        self.model = get_model_id(model_path)
+        self.config = get_config_hash(config_path)
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Used from the GUI's review thread and from KataGo response callbacks
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS move_infos (key TEXT PRIMARY KEY, move_infos TEXT NOT NULL)")
+        self.connection.commit()
+
+    def key(self, query):
+        params = {key: value for key, value in query.items() if key != "id"}
+        params["model"] = self.model
+        params["config"] = self.config
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def get(self, query):
+        key = self.key(query)
+        with self.lock:
+            row = self.connection.execute("SELECT move_infos FROM move_infos WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, move_infos):
+        key = self.key(query)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO move_infos (key, move_infos) VALUES (?, ?)", (key, json.dumps(move_infos)))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,89 @@
+import json
+from concurrent.futures import Future
+from threading import Thread, Lock
+from typing import Any, Dict, List
+
+from query_analysis_engine_example import KataGo
+
+class PipelinedKataGo(KataGo):
+    """KataGo analysis engine that keeps many queries in flight at once.
+
+    submit() sends a query and returns a Future right away. A reader thread matches responses to queries
+    by id, so KataGo can work on queries in parallel (numAnalysisThreads) instead of one at a time.
+    query_raw() still blocks like the base class, so this can be used anywhere a KataGo is.
+    """
+
+    def __init__(self, katago_path: str, config_path: str, model_path: str, additional_args: List[str] = []):
+        super().__init__(katago_path, config_path, model_path, additional_args)
+        self.lock = Lock()
+        # id -> (future, number of responses expected or None for a single response, responses so far)
+        self.pending = {}
+
+        self.reader_thread = Thread(target=self.read_responses)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    def submit(self, query: Dict[str,Any]) -> Future:
+        """Returns a Future of the response, or of the responses ordered by turn for queries with analyzeTurns."""
+        future = Future()
+        with self.lock:
+            if "id" not in query:
+                query["id"] = str(self.query_counter)
+                self.query_counter += 1
+            if query["id"] in self.pending:
+                raise ValueError(f"Query id {query['id']} is already in flight")
+
+            expected = len(query["analyzeTurns"]) if "analyzeTurns" in query else None
+            self.pending[query["id"]] = (future, expected, [])
+
+            self.katago.stdin.write((json.dumps(query) + "\n").encode())
+            self.katago.stdin.flush()
+        return future
+
+    def query_raw(self, query: Dict[str,Any]):
+        return self.submit(query).result()
+
+    def analyze_turns(self, query: Dict[str,Any], turns: List[int]) -> Future:
+        """Analyzes several turns of the game in query["moves"] with one query.
+        Returns a Future of the responses in the order of the turns, turn t being the position before move t."""
+        query = dict(query)
+        query["analyzeTurns"] = sorted(set(turns))
+        return self.submit(query)
+
+    def read_responses(self):
+        for line in self.katago.stdout:
+            line = line.decode().strip()
+            if line == "":
+                continue
+            response = json.loads(line)
+
+            if response.get("isDuringSearch", False):
+                continue
+            if "warning" in response:
+                print(f"KataGo warning: {response}")
+                continue
+
+            with self.lock:
+                if response.get("id") not in self.pending:
+                    continue
+                future, expected, responses = self.pending[response["id"]]
+
+                if "error" in response:
+                    del self.pending[response["id"]]
+                    future.set_exception(Exception(f"KataGo error: {response}"))
+                    continue
+
+                responses.append(response)
+                if expected is not None and len(responses) < expected:
+                    continue
+                del self.pending[response["id"]]
+
+            if expected is None:
+                future.set_result(response)
+            else:
+                future.set_result(sorted(responses, key=lambda r: r["turnNumber"]))
+
+        with self.lock:
+            for future, _, _ in self.pending.values():
+                future.set_exception(OSError("Unexpected katago exit"))
+            self.pending.clear()
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import zipfile
 
 import torch
 
@@ -39,11 +40,41 @@ def load_swa_model_state_dict(state_dict):
     return swa_model_state_dict
 
 
+def load_slim_model(state_dict, use_swa, device, pos_len):
+    """Model from an inference-only checkpoint written by slim_checkpoint.py. The model is built and initialized on
+    the meta device, so no weights are allocated or randomly initialized, then takes the loaded tensors as its own."""
+    from model_pytorch import Model
+
+    if use_swa and not state_dict["swa"]:
+        raise Exception("Slim checkpoint was converted without -use-swa, so it doesn't contain the swa_model")
+
+    logging.info(str(state_dict["config"]))
+    with torch.device("meta"):
+        model = Model(state_dict["config"],pos_len)
+        # Besides the random weights, this sets the norm scales. On the meta device the weights cost nothing
+        model.initialize()
+    model.load_state_dict(state_dict["model"], assign=True)
+    # Buffers that aren't part of a state dict, such as the score belief vectors, are stored separately
+    for name, tensor in state_dict["nonpersistent_buffers"].items():
+        module_name, _, buffer_name = name.rpartition(".")
+        model.get_submodule(module_name).register_buffer(buffer_name, tensor, persistent=False)
+    # Weights stored as fp16 run as float32. Tensors are copied out of the memory-mapped file straight to the device
+    model.float()
+    model.to(device)
+    return model
+
 def load_model(checkpoint_file, use_swa, device, pos_len=19, verbose=False):
     from model_pytorch import Model
     from torch.optim.swa_utils import AveragedModel
 
-    state_dict = torch.load(checkpoint_file,map_location="cpu")
+    # Memory-mapping only reads the tensors that get used, such as not the swa_model when use_swa is off.
+    # Checkpoints saved in the legacy non-zip format can't be memory-mapped.
+    state_dict = torch.load(checkpoint_file,map_location="cpu",mmap=zipfile.is_zipfile(checkpoint_file))
+
+    if state_dict.get("inference_only", False):
+        model = load_slim_model(state_dict, use_swa, device, pos_len)
+        # The weights of a checkpoint converted with -use-swa are the swa_model's
+        return (model, model if use_swa else None, {})
 
     if "config" in state_dict:
         model_config = state_dict["config"]
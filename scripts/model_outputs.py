@@ -0,0 +1,21 @@
+import time
+import numpy as np
+import torch
+
+def time_outputs(game_state, model, sgfmeta, max_batch_size, output_names, repeats):
+    """Outputs of model at every position of game_state, and the seconds per position they took."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        outputs = game_state.get_model_outputs_batch(model, sgfmeta=sgfmeta, max_batch_size=max_batch_size, output_names=output_names)
+    return outputs, (time.perf_counter() - start) / repeats / len(outputs)
+
+def max_difference(outputs, other_outputs):
+    """Largest difference between two sets of outputs of the same shape, over every value in them: the heads of
+    forward passes, or the per-position dicts of get_model_outputs_batch."""
+    if isinstance(outputs, dict):
+        return max(max_difference(outputs[name], other_outputs[name]) for name in outputs)
+    if isinstance(outputs, (list, tuple)):
+        return max((max_difference(output, other) for output, other in zip(outputs, other_outputs)), default=0.0)
+    if isinstance(outputs, torch.Tensor):
+        return float(torch.max(torch.abs(outputs.double() - other_outputs.double())))
+    return float(np.max(np.abs(np.asarray(outputs, dtype=np.float64) - np.asarray(other_outputs, dtype=np.float64))))
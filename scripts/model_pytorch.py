@@ -156,15 +156,18 @@ class BiasMask(torch.nn.Module):
         """
         Parameters:
         x: NCHW
-        mask: N1HW
+        mask: N1HW, or None if every point is on the board
         mask_sum: scalar
 
         Returns: NCHW
         """
         if self.scale is not None:
-            return (x * self.scale + self.beta) * mask
+            out = x * self.scale + self.beta
         else:
-            return (x + self.beta) * mask
+            out = x + self.beta
+        if mask is None:
+            return out
+        return out * mask
 
 
 class NormMask(torch.nn.Module):
@@ -285,14 +288,17 @@ class NormMask(torch.nn.Module):
     def apply_gamma_beta_scale_mask(self, x, mask):
         if self.scale is not None:
             if self.gamma is not None:
-                return (x * (self.gamma * self.scale) + self.beta) * mask
+                out = x * (self.gamma * self.scale) + self.beta
             else:
-                return (x * self.scale + self.beta) * mask
+                out = x * self.scale + self.beta
         else:
             if self.gamma is not None:
-                return (x * self.gamma + self.beta) * mask
+                out = x * self.gamma + self.beta
             else:
-                return (x + self.beta) * mask
+                out = x + self.beta
+        if mask is None:
+            return out
+        return out * mask
 
 
     def forward(self, x, mask, mask_sum: float):
@@ -368,18 +374,23 @@ class KataGPool(torch.nn.Module):
         """
         Parameters:
         x: NCHW
-        mask: N1HW
-        mask_sum_hw: N111
+        mask: N1HW, or None if every point is on the board
+        mask_sum_hw: N111, or None if every point is on the board
 
         Returns: NC11
         """
-        mask_sum_hw_sqrt_offset = torch.sqrt(mask_sum_hw) - 14.0
+        if mask is None:
+            mask_sum_hw_sqrt_offset = math.sqrt(x.shape[2] * x.shape[3]) - 14.0
+            layer_mean = torch.mean(x, dim=(2, 3), keepdim=True, dtype=torch.float32)
+            layer_max = torch.amax(x, dim=(2, 3), keepdim=True).to(torch.float32)
+        else:
+            mask_sum_hw_sqrt_offset = torch.sqrt(mask_sum_hw) - 14.0
 
-        layer_mean = torch.sum(x, dim=(2, 3), keepdim=True, dtype=torch.float32) / mask_sum_hw
-        # All activation functions we use right now are always greater than -1.0, and map 0 -> 0.
-        # So off-board areas will equal 0, and then this max is mask-safe if we assign -1.0 to off-board areas.
-        (layer_max,_argmax) = torch.max((x+(mask-1.0)).view(x.shape[0],x.shape[1],-1).to(torch.float32), dim=2)
-        layer_max = layer_max.view(x.shape[0],x.shape[1],1,1)
+            layer_mean = torch.sum(x, dim=(2, 3), keepdim=True, dtype=torch.float32) / mask_sum_hw
+            # All activation functions we use right now are always greater than -1.0, and map 0 -> 0.
+            # So off-board areas will equal 0, and then this max is mask-safe if we assign -1.0 to off-board areas.
+            (layer_max,_argmax) = torch.max((x+(mask-1.0)).reshape(x.shape[0],x.shape[1],-1).to(torch.float32), dim=2)
+            layer_max = layer_max.view(x.shape[0],x.shape[1],1,1)
 
         out_pool1 = layer_mean
         out_pool2 = layer_mean * (mask_sum_hw_sqrt_offset / 10.0)
@@ -397,14 +408,17 @@ class KataValueHeadGPool(torch.nn.Module):
         """
         Parameters:
         x: NCHW
-        mask: N1HW
-        mask_sum_hw: N111
+        mask: N1HW, or None if every point is on the board
+        mask_sum_hw: N111, or None if every point is on the board
 
         Returns: NC11
         """
-        mask_sum_hw_sqrt_offset = torch.sqrt(mask_sum_hw) - 14.0
-
-        layer_mean = torch.sum(x, dim=(2, 3), keepdim=True, dtype=torch.float32) / mask_sum_hw
+        if mask is None:
+            mask_sum_hw_sqrt_offset = math.sqrt(x.shape[2] * x.shape[3]) - 14.0
+            layer_mean = torch.mean(x, dim=(2, 3), keepdim=True, dtype=torch.float32)
+        else:
+            mask_sum_hw_sqrt_offset = torch.sqrt(mask_sum_hw) - 14.0
+            layer_mean = torch.sum(x, dim=(2, 3), keepdim=True, dtype=torch.float32) / mask_sum_hw
 
         out_pool1 = layer_mean
         out_pool2 = layer_mean * (mask_sum_hw_sqrt_offset / 10.0)
@@ -546,6 +560,8 @@ class KataConvAndAttentionPool(torch.nn.Module):
         n = x.shape[0]
         h = x.shape[2]
         w = x.shape[3]
+        if mask is None:
+            mask = torch.ones((n, 1, h, w), dtype=x.dtype, device=x.device)
 
         out = x
         outr = self.conv1r(out)
@@ -1225,16 +1241,19 @@ class DilationNestedBottleneckResBlock(torch.nn.Module):
         out = self.normactconvp(out, mask=mask, mask_sum_hw=None, mask_sum=None, extra_outputs=extra_outputs)
 
         assert len(out.shape) == 4
-        assert len(mask.shape) == 4
         n,c,h,w = out.shape
+        if mask is None:
+            # Padding puts points off the board, so the transposed blocks need a mask either way
+            mask_t = torch.ones((n, 1, h, w), dtype=out.dtype, device=out.device)
+        else:
+            assert len(mask.shape) == 4
+            mask_t = mask
         # pad to multiple of 3
         padding_h = (3 - h % 3) % 3
         padding_w = (3 - w % 3) % 3
         if padding_w != 0 or padding_h != 0:
             out = torch.nn.functional.pad(out, (0, padding_w, 0, padding_h))
-            mask_t = torch.nn.functional.pad(mask, (0, padding_w, 0, padding_h))
-        else:
-            mask_t = mask
+            mask_t = torch.nn.functional.pad(mask_t, (0, padding_w, 0, padding_h))
         padded_h = h + padding_h
         padded_w = w + padding_w
         padded_h_div3 = padded_h // 3
@@ -1378,9 +1397,10 @@ class PolicyHead(torch.nn.Module):
         outpolicy = outp
 
         # mask out parts outside the board by making them a huge neg number, so that they're 0 after softmax
-        outpolicy = outpolicy - (1.0 - mask) * 5000.0
+        if mask is not None:
+            outpolicy = outpolicy - (1.0 - mask) * 5000.0
         # NC(HW) concat with NC1
-        return torch.cat((outpolicy.view(outpolicy.shape[0],outpolicy.shape[1],-1), outpass.unsqueeze(-1)),dim=2)
+        return torch.cat((outpolicy.reshape(outpolicy.shape[0],outpolicy.shape[1],-1), outpass.unsqueeze(-1)),dim=2)
 
 
 class ValueHead(torch.nn.Module):
@@ -1513,10 +1533,15 @@ class ValueHead(torch.nn.Module):
         out_value = self.linear_valuehead(outv2)
         out_miscvalue = self.linear_miscvaluehead(outv2)
         out_moremiscvalue = self.linear_moremiscvaluehead(outv2)
-        out_ownership = self.conv_ownership(outv1) * mask
-        out_scoring = self.conv_scoring(outv1) * mask
-        out_futurepos = self.conv_futurepos(x) * mask
-        out_seki = self.conv_seki(x) * mask
+        out_ownership = self.conv_ownership(outv1)
+        out_scoring = self.conv_scoring(outv1)
+        out_futurepos = self.conv_futurepos(x)
+        out_seki = self.conv_seki(x)
+        if mask is not None:
+            out_ownership = out_ownership * mask
+            out_scoring = out_scoring * mask
+            out_futurepos = out_futurepos * mask
+            out_seki = out_seki * mask
 
         # Score belief head
         batch_size = x.shape[0]
@@ -1803,7 +1828,7 @@ class Model(torch.nn.Module):
 
     @property
     def device(self):
-        return self.linear_global.weight.device
+        return self.conv_spatial.weight.device
 
     def initialize(self):
         with torch.no_grad():
@@ -1895,13 +1920,23 @@ class Model(torch.nn.Module):
         input_global,
         input_meta = None,
         extra_outputs: Optional[ExtraOutputs] = None,
+        input_meta_encoded = None,
+        full_board: bool = False,
     ):
         # float_formatter = "{:.3f}".format
         # np.set_printoptions(formatter={'float_kind':float_formatter}, threshold=1000000, linewidth=10000)
 
-        mask = input_spatial[:, 0:1, :, :].contiguous()
-        mask_sum_hw = torch.sum(mask,dim=(2,3),keepdim=True)
-        mask_sum = torch.sum(mask)
+        if full_board:
+            # Callers pass full_board when every board in the batch fills pos_len, so every point is on the board
+            # and no mask is needed. Batch norm statistics need the mask, so this is for inference only.
+            assert not self.training
+            mask = None
+            mask_sum_hw = None
+            mask_sum = None
+        else:
+            mask = input_spatial[:, 0:1, :, :].contiguous()
+            mask_sum_hw = torch.sum(mask,dim=(2,3),keepdim=True)
+            mask_sum = torch.sum(mask)
 
         x_spatial = self.conv_spatial(input_spatial)
         x_global = self.linear_global(input_global).unsqueeze(-1).unsqueeze(-1)
@@ -1909,9 +1944,11 @@ class Model(torch.nn.Module):
         out = x_spatial + x_global
 
         if self.metadata_encoder is not None:
-            assert input_meta is not None
-            x_meta = self.metadata_encoder.forward(input_meta,extra_outputs)
-            out = out + x_meta.unsqueeze(-1).unsqueeze(-1)
+            # Callers may pass the output of metadata_encoder for input_meta they already encoded
+            if input_meta_encoded is None:
+                assert input_meta is not None
+                input_meta_encoded = self.metadata_encoder.forward(input_meta,extra_outputs)
+            out = out + input_meta_encoded.unsqueeze(-1).unsqueeze(-1)
 
         # print("TENSOR BEFORE TRUNK")
         # print(out)
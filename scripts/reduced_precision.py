@@ -0,0 +1,48 @@
+import warnings
+
+PRECISION_OPTIONS = ["fp32", "bf16", "int8"]
+
+class AutocastModel:
+    """A Model whose forward passes run under bf16 autocast: convolutions and matrix multiplies take bf16 inputs,
+    precision-sensitive ops such as softmax stay in float32. Outputs are returned as float32, like the Model's.
+    Everything else goes to the Model, so this can be used wherever a Model is."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __call__(self, *args, **kwargs):
+        import torch
+        with torch.autocast(device_type=torch.device(self.model.device).type, dtype=torch.bfloat16):
+            outputs = self.model(*args, **kwargs)
+        return tuple(tuple(output.float() for output in head) for head in outputs)
+
+def quantize_int8(model):
+    """Quantizes the linear layers of model to int8 in place, with activations quantized dynamically per batch.
+    torch's dynamic quantization only covers linear layers, so the convolutions, where most of the time goes,
+    stay in float32. CPU only."""
+    import torch
+    model.eval()
+    # torch.ao.quantization warns that it's deprecated in favor of torchao
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+def get_precision_error(precision, device, compile):
+    """Why the HSL server can't run the model at precision on device, with or without -compile, or None if it can."""
+    if precision != "fp32" and compile:
+        return "-compile only supports -precision fp32"
+    if precision == "int8" and device != "cpu":
+        return "int8 only runs on cpu"
+    return None
+
+def apply_precision(model, precision):
+    """Returns model running at precision, one of PRECISION_OPTIONS. int8 changes model in place."""
+    if precision == "bf16":
+        return AutocastModel(model)
+    if precision == "int8":
+        return quantize_int8(model)
+    return model
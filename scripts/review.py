@@ -0,0 +1,529 @@
+import subprocess
+import json
+import sys
+import os
+import atexit
+import datetime
+import math
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+from threading import Thread
+from concurrent.futures import Future
+
+from gamestate import GameState
+from board import Board
+from sgfmetadata import SGFMetadata
+from kata_client import PipelinedKataGo
+from wire_format import BINARY_FRAME_MARKER, read_binary_frame
+
+from sgfmill import sgf, sgf_moves
+
+GRID_SIZE = 7
+GRID_RADIUS = math.floor(GRID_SIZE / 2)
+
+MIN_SCORE_DIFF_ACTUAL_HSL = 2
+MAX_SCORE_DIFF_ACTUAL_HSL = 10
+MAX_SCORE_DIFF_HSL_KATA = 1
+
+HSL_SOURCE = "OGS"
+HSL_RANK = "2d"
+HSL_DATE = 2022
+HSL_TIME_CONTROL = "Slow"
+
+HSL_ACTUAL_COMPARE_VISITS = 500
+KATA_BEST_VISITS = 2_500
+
+# Score the HSL and actual moves from the moveInfos of the grid query instead of two queries of their own.
+# A move the grid search gave fewer than KATA_MIN_MOVE_VISITS visits still gets its own query.
+# Run compare_kata_queries.py to see how far the scores move for your KataGo model
+KATA_MERGED_QUERY = False
+KATA_MIN_MOVE_VISITS = 100
+
+# Before the per-move queries, analyze all of the player's turns with one cheap query and skip the moves that
+# lost fewer than MIN_SCORE_DIFF_ACTUAL_HSL - KATA_PROFILE_MARGIN points, as they can't become cards
+KATA_PROFILE_PREFILTER = False
+KATA_PROFILE_VISITS = 200
+KATA_PROFILE_MARGIN = 1
+
+# "binary" sends model outputs as raw float32 buffers, "json" as text
+HSL_WIRE_FORMAT = "binary"
+
+# KataGo results are kept here between reviews. Set to None to disable
+KATA_CACHE_PATH = "kata_cache.sqlite"
+
+HSL_SOURCE_OPTIONS = ["KG","OGS","KGS","Fox","Tygem(Unused)","GoGoD","Go4Go"]
+HSL_RANK_OPTIONS = [
+    "KG","9d","8d","7d","6d","5d","4d","3d","2d","1d","1k","2k","3k","4k","5k","6k","7k","8k","9k","10k","11k","12k","13k","14k","15k","16k","17k","18k","19k","20k"
+]
+HSL_DATE_OPTIONS = [
+    1800,1825,1850,1875,1900,1915,1930,1940,1950,1960,1970,1980,1985,1990,1995,2000,2005,2008,2010,2012,2013,2014,2015,2016,2017,2018,2019,2020,2021,2022,2023
+]
+HSL_TIME_CONTROL_OPTIONS = ["Blitz","Fast","Slow","Unknown"]
+
+def get_sgfmeta(source, rank, date, time_control):
+    rank_idx = HSL_RANK_OPTIONS.index(rank)
+    tc_idx = HSL_TIME_CONTROL_OPTIONS.index(time_control)
+    return SGFMetadata(
+        inverseBRank = rank_idx,
+        inverseWRank = rank_idx,
+        bIsHuman = rank_idx != 0,
+        wIsHuman = rank_idx != 0,
+        gameIsUnrated = False,
+        gameRatednessIsUnknown = source == "KGS",
+        tcIsUnknown = time_control == "Unknown",
+        tcIsByoYomi = time_control != "Unknown",
+        mainTimeSeconds = [300,900,1800,0][tc_idx],
+        periodTimeSeconds = [10,15,30,0][tc_idx],
+        byoYomiPeriods = [5,5,5,0][tc_idx],
+        gameDate = datetime.date(date,6,1),
+        source = HSL_SOURCE_OPTIONS.index(source),
+    )
+
+def get_rank_sweep_sgfmetas(sgfmeta):
+    """sgfmeta at each of HSL_RANK_OPTIONS, in that order, for get_model_outputs_sweep."""
+    return [dataclasses.replace(sgfmeta, inverseBRank=rank_idx, inverseWRank=rank_idx, bIsHuman=rank_idx != 0, wIsHuman=rank_idx != 0)
+            for rank_idx in range(len(HSL_RANK_OPTIONS))]
+
+def get_difficulty_rank(top_moves_by_rank, hsl_move, rank_idx):
+    """The weakest of HSL_RANK_OPTIONS from which the top HSL move stays hsl_move at every rank up to the one at rank_idx,
+    given the top HSL move at each rank. Players weaker than that aren't expected to find the move."""
+    weakest_idx = rank_idx
+    while weakest_idx + 1 < len(top_moves_by_rank) and top_moves_by_rank[weakest_idx + 1] == hsl_move:
+        weakest_idx += 1
+    return HSL_RANK_OPTIONS[weakest_idx]
+
+def load_sgf_game_state(file_path):
+    return load_sgf_game_state_with_setup(file_path)[0]
+
+def load_sgf_game_state_with_setup(file_path):
+    """The game in an SGF file, and how many of its first moves are setup stones, such as handicap stones,
+    which become moves in the GameState but weren't chosen by the players."""
+    with open(file_path, 'rb') as f:
+        game = sgf.Sgf_game.from_bytes(f.read())
+
+    size = game.get_size()
+    if size < 9 or size > 19:
+        raise ValueError("Board size must be between 9 and 19 inclusive.")
+
+    board, plays = sgf_moves.get_setup_and_moves(game)
+
+    moves = []
+    for x in range(size):
+        for y in range(size):
+            color = board.get(x, y)
+            if color is not None:
+                moves.append((y, 18 - x, (Board.BLACK if color == "b" else Board.WHITE)))
+    num_setup_moves = len(moves)
+
+    for color, move in plays:
+        if move is not None:
+            x, y = move
+            moves.append((y, 18 - x, (Board.BLACK if color == "b" else Board.WHITE)))
+
+    game_state = GameState(size, GameState.RULES_JAPANESE)
+    for (x,y,color) in moves:
+        game_state.play(color, game_state.board.loc(x,y))
+
+    return game_state, num_setup_moves
+
+class Coord():
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        if isinstance(other, Coord):
+            return self.x == other.x and self.y == other.y
+        return False
+
+    def __str__(self):
+        return f"({self.x}, {self.y})"
+
+def loc_state_to_coord(board, state):
+    return Coord(board.loc_x(state), board.loc_y(state))
+
+def loc_coord_to_state(board, coord):
+    return board.loc(coord.x, coord.y)
+
+def loc_kata_to_coord(kata):
+    chars = [char for char in kata]
+
+    x = ord(chars[0])
+    # 'I' is skipped
+    if x <= 72:
+        x -= 65
+    else:
+        x -= 66
+
+    return Coord(x, 19 - int(''.join(chars[1:])))
+
+def loc_coord_to_kata(coord):
+    return "ABCDEFGHJKLMNOPQRSTUVWXYZ"[coord.x] + str(19 - coord.y)
+
+def loc_state_to_kata(board, state):
+    return loc_coord_to_kata(loc_state_to_coord(board, state))
+
+def is_player_move(player, pla):
+    return (player == "B" and pla == Board.BLACK) or (player == "W" and pla == Board.WHITE)
+
+def start_hsl_server(hsl_model_path, hsl_device, additional_args=[], wire_format=HSL_WIRE_FORMAT):
+    # print(f"Starting hsl server with command: {server_command}")
+    # Binary pipes, since responses may be binary frames
+    server_process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "humanslnet_server.py"), "-checkpoint", hsl_model_path, "-device", hsl_device, *additional_args],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    atexit.register(server_process.terminate)
+
+    def print_stderr():
+        while True:
+            line = server_process.stderr.readline()
+            if not line:
+                returncode = server_process.poll()
+                if returncode is not None:
+                    return
+            print(line.decode(errors="replace"),end="")
+
+    t = Thread(target=print_stderr)
+    t.daemon = True
+    t.start()
+
+    if wire_format != "json":
+        set_wire_format(server_process, wire_format)
+
+    return server_process
+
+def set_wire_format(server_process, wire_format):
+    """Asks the server to answer in wire_format from now on. Returns the format it agreed to, which is "json" if it doesn't know wire_format."""
+    send_command(server_process, {"command": "set_wire_format", "format": wire_format})
+    return receive_response(server_process).get("format", "json")
+
+def send_command(server_process, command):
+    # print(f"Sending: {json.dumps(command)}")
+    server_process.stdin.write((json.dumps(command) + "\n").encode())
+    server_process.stdin.flush()
+
+def receive_response(server_process):
+    # print(f"Waiting for response")
+    while True:
+        returncode = server_process.poll()
+        if returncode is not None:
+            raise OSError(f"Server terminated unexpectedly with {returncode=}")
+        first_byte = server_process.stdout.read(1)
+        if first_byte == BINARY_FRAME_MARKER:
+            return read_binary_frame(server_process.stdout)
+        response = (first_byte + server_process.stdout.readline()).decode().strip()
+        if response != "":
+            break
+    # print(f"Got response (first 100 chars): {str(response[:100])}")
+    return json.loads(response)
+
+def start_kata_server(katago_exe_path, katago_analysis_cfg_path, katago_model_path):
+    kata_server = PipelinedKataGo(katago_exe_path,
+                                  katago_analysis_cfg_path,
+                                  katago_model_path)
+
+    atexit.register(kata_server.close)
+    return kata_server
+
+def get_highest_hsl_loc(moves_and_probs0):
+    highest_hsl_val = 0
+    highest_hsl_loc = 0
+    for prob in moves_and_probs0:
+        if prob[1] > highest_hsl_val:
+            highest_hsl_val = prob[1]
+            highest_hsl_loc = prob[0]
+    return highest_hsl_loc
+
+def get_best_score_leads(move_infos, player):
+    """The moves within 1 point of the best score lead for player, best first, as (Coord, score lead)."""
+    result_by_score = None
+    if player == "B":
+        result_by_score = sorted(move_infos, key=lambda x: x["scoreLead"], reverse=True)
+    else:
+        result_by_score = sorted(move_infos, key=lambda x: x["scoreLead"])
+
+    output = []
+    best_score = result_by_score[0]["scoreLead"]
+    for move in result_by_score:
+        if abs(move["scoreLead"] - best_score) > 1:
+            break
+
+        output.append((loc_kata_to_coord(move["move"]), move["scoreLead"]))
+
+    return output
+
+def passes_actual_hsl_threshold(player, hsl_score, actual_score):
+    """Whether the actual move loses enough points against the HSL move to be worth a card, but not so many that it was a blunder."""
+    if player == "B":
+        return hsl_score - MAX_SCORE_DIFF_ACTUAL_HSL <= actual_score <= hsl_score - MIN_SCORE_DIFF_ACTUAL_HSL
+    else:
+        return hsl_score + MIN_SCORE_DIFF_ACTUAL_HSL <= actual_score <= hsl_score + MAX_SCORE_DIFF_ACTUAL_HSL
+
+def is_card(player, hsl_score, actual_score, kata_score):
+    """Whether KataGo's scores make a candidate a card. kata_score may be None if the actual-vs-HSL threshold already failed."""
+    if kata_score is None or not passes_actual_hsl_threshold(player, hsl_score, actual_score):
+        return False
+    return abs(kata_score - hsl_score) <= MAX_SCORE_DIFF_HSL_KATA
+
+def get_grid_moves(actual_move):
+    allow_moves = []
+    for x in range(max(actual_move.x - GRID_RADIUS, 0), min(actual_move.x + GRID_RADIUS, 18) + 1):
+        for y in range(max(actual_move.y - GRID_RADIUS, 0), min(actual_move.y + GRID_RADIUS, 18) + 1):
+            allow_moves.append(Coord(x, y))
+    return allow_moves
+
+@dataclass
+class Card:
+    hsl_move: Coord
+    actual_move: Coord
+    hsl_score: float
+    actual_score: float
+    kata_score: float
+    # Weakest rank that already plays the HSL move, see get_difficulty_rank
+    difficulty: Optional[str] = None
+
+@dataclass
+class Candidate:
+    """A position where HSL and the player disagree on a nearby move, before KataGo has looked at it."""
+    index: int
+    moves: list
+    board: Board
+    hsl_move: Coord
+    actual_move: Coord
+
+class CardFinder:
+    """Decides whether a position is worth a flashcard, using the HSL policy and KataGo score leads.
+
+    KataGo queries are sent without waiting for earlier ones, so KataGo can evaluate them in parallel.
+    """
+
+    def __init__(self, kata_server, kata_cache=None, merged_query=KATA_MERGED_QUERY):
+        self.kata_server = kata_server
+        self.kata_cache = kata_cache
+        self.merged_query = merged_query
+        self.kata_queries = 0
+        self.kata_visits = 0
+
+    def get_kata_query(self, moves, board, player, max_visits, allow_moves = [], avoid_moves = []):
+        kata_moves = []
+        for pla, loc in moves:
+            color = "b"
+            if (pla == 2):
+                color = "w"
+
+            move = loc_state_to_kata(board, loc)
+            kata_moves.append((color, move))
+
+        query = {
+            "id": str(self.kata_server.query_counter),
+            "moves": kata_moves,
+            "rules": "Japanese",
+            "komi": 6.5,
+            "boardXSize": 19,
+            "boardYSize": 19,
+            "maxVisits": max_visits
+        }
+        self.kata_server.query_counter += 1
+
+        if allow_moves:
+            query["allowMoves"] = [{
+                "player": player,
+                "moves": [loc_coord_to_kata(coord) for coord in allow_moves],
+                "untilDepth": 1
+            }]
+
+        if avoid_moves:
+            query["avoidMoves"] = [{
+                "player": player,
+                "moves": [loc_coord_to_kata(coord) for coord in avoid_moves],
+                "untilDepth": 1
+            }]
+
+        return query
+
+    def submit_kata_move_infos(self, moves, board, player, max_visits, allow_moves = [], avoid_moves = []):
+        """Sends the query right away and returns a Future of its moveInfos."""
+        query = self.get_kata_query(moves, board, player, max_visits, allow_moves, avoid_moves)
+        output = Future()
+        self.kata_queries += 1
+        self.kata_visits += max_visits
+
+        if self.kata_cache is not None:
+            result = self.kata_cache.get(query)
+            if result is not None:
+                output.set_result(result)
+                return output
+
+        def on_response(response):
+            try:
+                result = response.result()["moveInfos"]
+                if self.kata_cache is not None:
+                    self.kata_cache.put(query, result)
+                output.set_result(result)
+            except Exception as e:
+                output.set_exception(e)
+
+        self.kata_server.submit(query).add_done_callback(on_response)
+        return output
+
+    def submit_kata_score_lead(self, moves, board, player, max_visits, allow_moves = [], avoid_moves = []):
+        """Sends the query right away and returns a Future of what get_kata_score_lead returns."""
+        output = Future()
+
+        def on_move_infos(move_infos):
+            try:
+                output.set_result(get_best_score_leads(move_infos.result(), player))
+            except Exception as e:
+                output.set_exception(e)
+
+        self.submit_kata_move_infos(moves, board, player, max_visits, allow_moves, avoid_moves).add_done_callback(on_move_infos)
+        return output
+
+    def submit_score_loss_profile(self, moves, board, player, move_indices):
+        """Sends one query for the whole game and returns a Future of {move index: points lost by that move}, from player's view.
+        A move's loss is the score lead before it minus the score lead after it."""
+        query = self.get_kata_query(moves, board, player, KATA_PROFILE_VISITS)
+        turns = sorted(set(move_indices) | {i + 1 for i in move_indices})
+        output = Future()
+        self.kata_queries += 1
+        self.kata_visits += KATA_PROFILE_VISITS * len(turns)
+
+        def set_profile(score_leads):
+            lead_by_turn = dict(zip(turns, score_leads))
+            sign = 1 if player == "B" else -1
+            output.set_result({i: sign * (lead_by_turn[i] - lead_by_turn[i + 1]) for i in move_indices})
+
+        if self.kata_cache is not None:
+            # Stores the root score leads of the turns rather than moveInfos
+            cache_query = dict(query, analyzeTurns=turns)
+            result = self.kata_cache.get(cache_query)
+            if result is not None:
+                set_profile(result)
+                return output
+
+        def on_responses(responses):
+            try:
+                score_leads = [response["rootInfo"]["scoreLead"] for response in responses.result()]
+                if self.kata_cache is not None:
+                    self.kata_cache.put(cache_query, score_leads)
+                set_profile(score_leads)
+            except Exception as e:
+                output.set_exception(e)
+
+        self.kata_server.analyze_turns(query, turns).add_done_callback(on_responses)
+        return output
+
+    def filter_by_score_loss(self, candidates, profile):
+        """The candidates whose actual move lost enough points in the score loss profile to possibly become a card."""
+        # Candidate.moves are the moves before the candidate's, so its length is the move index
+        return [candidate for candidate in candidates if profile[len(candidate.moves)] >= MIN_SCORE_DIFF_ACTUAL_HSL - KATA_PROFILE_MARGIN]
+
+    def get_kata_score_lead(self, game_state, player, max_visits, allow_moves = [], avoid_moves = []):
+        return self.submit_kata_score_lead(game_state.moves, game_state.board, player, max_visits, allow_moves, avoid_moves).result()
+
+    def find_card(self, game_state, player, moves_and_probs0, actual_loc):
+        """Returns a Card if the player's actual move at this position makes a good question, else None."""
+        return self.find_cards([(game_state.moves, game_state.board, get_highest_hsl_loc(moves_and_probs0), actual_loc)], player)[0]
+
+    def find_cards(self, positions, player):
+        """Like find_card for a list of (moves, board, hsl_loc, actual_loc), with the KataGo queries of all positions in flight together.
+        Returns a Card or None for each position."""
+        cards = [None] * len(positions)
+        for candidate, card in zip(*self.score_candidates(self.get_candidates(positions), player)):
+            cards[candidate.index] = card
+        return cards
+
+    def get_candidates(self, positions):
+        """The positions, as Candidates, where the HSL move differs from the actual move but lies within the grid. Needs no KataGo."""
+        candidates = []
+        for i, (moves, board, hsl_loc, actual_loc) in enumerate(positions):
+            # A pass has no place on the board to ask about
+            if hsl_loc == Board.PASS_LOC or actual_loc == Board.PASS_LOC:
+                continue
+
+            hsl_move = loc_state_to_coord(board, hsl_loc)
+            actual_move = loc_state_to_coord(board, actual_loc)
+
+            if hsl_move == actual_move:
+                continue
+
+            if abs(hsl_move.x - actual_move.x) > GRID_RADIUS or abs(hsl_move.y - actual_move.y) > GRID_RADIUS:
+                continue
+
+            candidates.append(Candidate(i, moves, board, hsl_move, actual_move))
+        return candidates
+
+    def score_candidates(self, candidates, player):
+        """Asks KataGo about all candidates at once and applies the score thresholds.
+        Returns the candidates that became cards and their Cards."""
+        found = []
+        cards = []
+        for candidate, (hsl_score, actual_score, kata_score) in zip(candidates, self.get_kata_scores(candidates, player)):
+            if not is_card(player, hsl_score, actual_score, kata_score):
+                continue
+
+            found.append(candidate)
+            cards.append(Card(candidate.hsl_move, candidate.actual_move, hsl_score, actual_score, kata_score))
+
+        return found, cards
+
+    def get_kata_scores(self, candidates, player):
+        """Returns (hsl_score, actual_score, kata_score) for each candidate. Without a merged query,
+        kata_score is None for the candidates that fail the actual-vs-HSL threshold, since their grid query is skipped."""
+        if self.merged_query:
+            return self.get_merged_kata_scores(candidates, player)
+
+        futures = []
+        for candidate in candidates:
+            hsl_future = self.submit_kata_score_lead(candidate.moves, candidate.board, player, HSL_ACTUAL_COMPARE_VISITS, [candidate.hsl_move])
+            actual_future = self.submit_kata_score_lead(candidate.moves, candidate.board, player, HSL_ACTUAL_COMPARE_VISITS, [candidate.actual_move])
+            futures.append((hsl_future, actual_future))
+
+        scores = []
+        for candidate, (hsl_future, actual_future) in zip(candidates, futures):
+            hsl_score = hsl_future.result()[0][1]
+            actual_score = actual_future.result()[0][1]
+
+            # print(f"HSL= {str(candidate.hsl_move)}: {hsl_score:.2f} | Actual= {str(candidate.actual_move)}: {actual_score:.2f}")
+
+            # The expensive grid query is only worth it for the candidates that passed
+            kata_future = None
+            if passes_actual_hsl_threshold(player, hsl_score, actual_score):
+                kata_future = self.submit_kata_score_lead(candidate.moves, candidate.board, player, KATA_BEST_VISITS, get_grid_moves(candidate.actual_move))
+            scores.append((hsl_score, actual_score, kata_future))
+
+        return [(hsl_score, actual_score, kata_future.result()[0][1] if kata_future is not None else None)
+                for hsl_score, actual_score, kata_future in scores]
+
+    def get_merged_kata_scores(self, candidates, player):
+        futures = [self.submit_kata_move_infos(candidate.moves, candidate.board, player, KATA_BEST_VISITS, get_grid_moves(candidate.actual_move))
+                   for candidate in candidates]
+
+        pending = []
+        for candidate, future in zip(candidates, futures):
+            move_infos = future.result()
+            kata_score = get_best_score_leads(move_infos, player)[0][1]
+            move_info_by_move = {move_info["move"]: move_info for move_info in move_infos}
+
+            # A score from too few visits is noise, so such moves are searched on their own like without a merged query
+            move_scores = []
+            for move in [candidate.hsl_move, candidate.actual_move]:
+                move_info = move_info_by_move.get(loc_coord_to_kata(move))
+                if move_info is not None and move_info["visits"] >= KATA_MIN_MOVE_VISITS:
+                    move_scores.append(move_info["scoreLead"])
+                else:
+                    move_scores.append(self.submit_kata_score_lead(candidate.moves, candidate.board, player, HSL_ACTUAL_COMPARE_VISITS, [move]))
+            pending.append((move_scores, kata_score))
+
+        scores = []
+        for (hsl_score, actual_score), kata_score in pending:
+            if isinstance(hsl_score, Future):
+                hsl_score = hsl_score.result()[0][1]
+            if isinstance(actual_score, Future):
+                actual_score = actual_score.result()[0][1]
+            scores.append((hsl_score, actual_score, kata_score))
+        return scores
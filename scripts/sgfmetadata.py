@@ -52,6 +52,7 @@ class SGFMetadata:
 
     @classmethod
     def of_dict(cls, data: dict):
+        data = dict(data)
         data["gameDate"] = datetime.date.fromisoformat(data["gameDate"])
         return cls(**data)
 
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import argparse
+import torch
+
+from load_model import load_model
+from compiled_model import get_example_inputs
+from model_outputs import max_difference
+
+def get_slim_state_dict(model, use_swa, fp16):
+    """Everything load_model needs to rebuild model for inference: its config and tensors, without the swa_model,
+    metrics or train state of a training checkpoint."""
+    state_dict = model.state_dict()
+    if fp16:
+        state_dict = {name: (tensor.half() if tensor.is_floating_point() else tensor) for name, tensor in state_dict.items()}
+    nonpersistent_buffers = {name: buffer for name, buffer in model.named_buffers() if name not in state_dict}
+    return {
+        "inference_only": True,
+        "config": model.config,
+        "swa": use_swa,
+        "model": state_dict,
+        "nonpersistent_buffers": nonpersistent_buffers,
+    }
+
+def time_load(checkpoint_file, use_swa, device):
+    start = time.perf_counter()
+    model, swa_model, _ = load_model(checkpoint_file, use_swa=use_swa, device=device, pos_len=19, verbose=False)
+    return (swa_model if use_swa else model), time.perf_counter() - start
+
+def main():
+    """Converts a training checkpoint into an inference-only one that load_model memory-maps and loads without
+    initializing the model first, then checks that both give the same outputs and how long each takes to load."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-checkpoint', help='Training checkpoint to convert', required=True)
+    parser.add_argument('-output', help='Inference-only checkpoint to write', required=True)
+    parser.add_argument('-use-swa', help='Keep the weights of the SWA model instead of the model', action="store_true", required=False)
+    parser.add_argument('-fp16', help='Store the weights as fp16, for half the size. The model still runs in float32', action="store_true", required=False)
+    parser.add_argument('-device', help='Device to check the converted checkpoint on, such as cpu or cuda:0', default="cpu", required=False)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.checkpoint) == os.path.abspath(args.output):
+        print("Error: The output would overwrite the checkpoint")
+        sys.exit(1)
+
+    model, load_seconds = time_load(args.checkpoint, args.use_swa, args.device)
+    torch.save(get_slim_state_dict(model.to("cpu"), args.use_swa, args.fp16), args.output)
+    model.to(args.device)
+    slim_model, slim_load_seconds = time_load(args.output, args.use_swa, args.device)
+
+    example_inputs = get_example_inputs(model)
+    model.eval()
+    slim_model.eval()
+    with torch.no_grad():
+        difference = max_difference(
+            model(example_inputs[0], example_inputs[1], input_meta_encoded=example_inputs[2] if len(example_inputs) > 2 else None),
+            slim_model(example_inputs[0], example_inputs[1], input_meta_encoded=example_inputs[2] if len(example_inputs) > 2 else None),
+        )
+
+    print(f"{args.checkpoint}: {os.path.getsize(args.checkpoint) / 1e6:.1f} MB, loads in {load_seconds:.2f}s")
+    print(f"{args.output}: {os.path.getsize(args.output) / 1e6:.1f} MB, loads in {slim_load_seconds:.2f}s")
+    print(f"Max difference between their outputs: {difference:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import json
+import struct
+import numpy as np
+
+# Binary frames start with this byte, so they can't be mistaken for a JSON line, which starts with "{"
+BINARY_FRAME_MARKER = b"\x00"
+
+# (loc, value) pairs such as moves_and_probs0 and ownership_by_loc
+LOC_VALUE_DTYPE = np.dtype([("loc", "<i4"), ("value", "<f4")])
+
+def is_loc_value_list(obj):
+    return len(obj) > 0 and isinstance(obj[0], tuple) and len(obj[0]) == 2 and isinstance(obj[0][0], int)
+
+def encode_binary(response):
+    """Encodes a response as a binary frame: the marker, the length of a JSON header as a little-endian uint32,
+    the header, then the raw buffers. Arrays and lists of (loc, value) pairs are moved out of the header into
+    float32 and LOC_VALUE_DTYPE buffers, and replaced by {"buffer": index, ...} in it."""
+    buffers = []
+
+    def extract(obj):
+        if isinstance(obj, np.ndarray):
+            buffers.append(np.ascontiguousarray(obj, dtype="<f4").tobytes())
+            return {"buffer": len(buffers) - 1, "shape": list(obj.shape)}
+        if isinstance(obj, list) and is_loc_value_list(obj):
+            buffers.append(np.array(obj, dtype=LOC_VALUE_DTYPE).tobytes())
+            return {"buffer": len(buffers) - 1, "pairs": True}
+        if isinstance(obj, dict):
+            return {key: extract(value) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [extract(value) for value in obj]
+        if isinstance(obj, np.floating):
+            return float(obj)
+        return obj
+
+    header = extract(response)
+    header_bytes = json.dumps({"response": header, "buffer_lengths": [len(buffer) for buffer in buffers]}).encode()
+    return BINARY_FRAME_MARKER + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(buffers)
+
+def decode_binary(header_bytes, data):
+    """Decodes the header and buffers of a binary frame. Arrays come back as float32 numpy arrays
+    and (loc, value) pairs as lists of tuples, like the server had them."""
+    header = json.loads(header_bytes)
+    buffers = []
+    offset = 0
+    for length in header["buffer_lengths"]:
+        buffers.append(data[offset:offset + length])
+        offset += length
+
+    def restore(obj):
+        if isinstance(obj, dict):
+            if "buffer" in obj:
+                buffer = buffers[obj["buffer"]]
+                if obj.get("pairs", False):
+                    return np.frombuffer(buffer, dtype=LOC_VALUE_DTYPE).tolist()
+                return np.frombuffer(buffer, dtype="<f4").reshape(obj["shape"])
+            return {key: restore(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [restore(value) for value in obj]
+        return obj
+
+    return restore(header["response"])
+
+def read_binary_frame(stream):
+    """Reads the rest of a binary frame from a binary stream, after its marker byte."""
+    header_length = struct.unpack("<I", stream.read(4))[0]
+    header_bytes = stream.read(header_length)
+    buffer_lengths = json.loads(header_bytes)["buffer_lengths"]
+    data = stream.read(sum(buffer_lengths))
+    return decode_binary(header_bytes, data)